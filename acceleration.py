@@ -0,0 +1,394 @@
+import os
+import time
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+from dotenv import load_dotenv
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlalchemy import MetaData, Table, create_engine, select
+from sqlalchemy.types import (
+    BigInteger, Boolean, Date, DateTime, Float, Integer, Interval, LargeBinary, Numeric, SmallInteger, Time
+)
+from query_executor import connection_url_template, database_url
+from sql_validator import SQLGLOT_DIALECTS
+
+try:
+    import duckdb
+except ImportError:
+    # The acceleration tier is optional, queries then always go to the source database
+    duckdb = None
+
+load_dotenv()
+
+# Tables to snapshot, as 'database.table' separated by commas
+ACCELERATION_TABLES = os.getenv("ACCELERATION_TABLES", "")
+# Additional tables picked from the most queried ones, 0 disables log-based selection
+ACCELERATION_HOT_TABLES = int(os.getenv("ACCELERATION_HOT_TABLES", "0"))
+ACCELERATION_PATH = os.getenv("ACCELERATION_PATH", "fs_cache/acceleration")
+ACCELERATION_REFRESH_S = float(os.getenv("ACCELERATION_REFRESH_S", "300"))
+# Snapshots older than this are not used, queries fall back to the source database
+ACCELERATION_MAX_STALENESS_S = float(os.getenv("ACCELERATION_MAX_STALENESS_S", "900"))
+
+# DuckDB compares strings byte by byte while MySQL's default collations ignore case
+# and accents, so 'Shipped' = 'shipped' would return different rows. Snapshots of
+# such sources use a matching DuckDB collation, '' keeps DuckDB's binary comparison
+DEFAULT_COLLATIONS = {"mysql": "noaccent.nocase"}
+
+SNAPSHOT_CHUNK_ROWS = 50000
+# Queries a table needs before it counts as hot
+HOT_TABLE_MIN_QUERIES = 5
+
+
+def parse_table_list(value: str) -> List[Tuple[str, str]]:
+    tables = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            database_name, table_name = item.split(".")
+        except ValueError:
+            raise ValueError(f"Invalid table format: {item}. Expected format: 'database.table'")
+        tables.append((database_name, table_name))
+    return tables
+
+
+def duckdb_type(column_type) -> str:
+    """DuckDB type holding the values of a reflected SQLAlchemy column type exactly"""
+    if isinstance(column_type, Boolean):
+        return "BOOLEAN"
+    if isinstance(column_type, Integer):
+        if isinstance(column_type, BigInteger) and getattr(column_type, "unsigned", False):
+            return "UBIGINT"
+        return "SMALLINT" if isinstance(column_type, SmallInteger) else "BIGINT"
+    # Float derives from Numeric, so it is checked first
+    if isinstance(column_type, Float):
+        return "DOUBLE"
+    if isinstance(column_type, Numeric):
+        if column_type.precision is None or column_type.precision > 38:
+            # e.g. PostgreSQL's unbounded numeric, DuckDB decimals stop at 38 digits
+            return "DOUBLE"
+        return f"DECIMAL({column_type.precision}, {column_type.scale or 0})"
+    if isinstance(column_type, DateTime):
+        return "TIMESTAMPTZ" if column_type.timezone else "TIMESTAMP"
+    if isinstance(column_type, Date):
+        return "DATE"
+    if isinstance(column_type, Time):
+        return "TIME"
+    if isinstance(column_type, Interval):
+        return "INTERVAL"
+    if isinstance(column_type, LargeBinary):
+        return "BLOB"
+    return "VARCHAR"
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _result_rows(columns: List[str], rows: List[tuple]) -> List[tuple]:
+    """Wrap DuckDB tuples so they carry column names like SQLAlchemy Row objects"""
+    row_type = type("Row", (tuple,), {"__slots__": (), "_fields": tuple(columns)})
+    return [row_type(row) for row in rows]
+
+
+class AccelerationTier:
+    """Serve read-only queries on hot tables from a local DuckDB snapshot.
+
+    Selected tables are copied from the source database into a DuckDB file,
+    one schema per source database, and refreshed on a schedule. A query is
+    routed to DuckDB, transpiled from the source dialect, only when every
+    table it reads has a snapshot younger than the staleness bound;
+    otherwise it is left to the source database.
+
+    String comparisons follow the source's collation where DuckDB has an
+    equivalent (see DEFAULT_COLLATIONS). Pattern matching (LIKE, REGEXP)
+    ignores DuckDB's collation, so those queries always go to the source
+    database when the collation is case-insensitive.
+    """
+
+    def __init__(
+        self,
+        tables: Optional[List[Tuple[str, str]]] = None,
+        hot_tables: int = ACCELERATION_HOT_TABLES,
+        path: str = ACCELERATION_PATH,
+        refresh_s: float = ACCELERATION_REFRESH_S,
+        max_staleness_s: float = ACCELERATION_MAX_STALENESS_S,
+        engine_factory=None,
+        collation: Optional[str] = None,
+    ):
+        if duckdb is None:
+            raise ImportError("The acceleration tier requires duckdb, install it with: pip install duckdb")
+        self.tables = set(parse_table_list(ACCELERATION_TABLES) if tables is None else tables)
+        self.hot_tables = hot_tables
+        self.refresh_s = refresh_s
+        self.max_staleness_s = max_staleness_s
+        self.dialect = SQLGLOT_DIALECTS[os.getenv("DATASOURCE_TYPE", "mysql").lower()]
+        if collation is None:
+            collation = os.getenv("ACCELERATION_COLLATION", DEFAULT_COLLATIONS.get(self.dialect, ""))
+        self.collation = collation
+        # engine_factory(database_name) -> SQLAlchemy engine of the source database
+        self.engine_factory = engine_factory or (
+            lambda database_name: create_engine(
+                database_url(connection_url_template(), database_name)
+            )
+        )
+
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.connection = duckdb.connect(str(Path(path) / "snapshots.duckdb"))
+        self.connection.execute(f"SET default_collation = '{self.collation}'")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS _snapshots ("
+            "database_name VARCHAR, table_name VARCHAR, refreshed_at DOUBLE, row_count BIGINT, "
+            "PRIMARY KEY (database_name, table_name))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS _table_queries ("
+            "database_name VARCHAR, table_name VARCHAR, queries BIGINT, "
+            "PRIMARY KEY (database_name, table_name))"
+        )
+
+        self._lock = threading.Lock()
+        # (database, table) -> epoch seconds of the snapshot, mirrored from _snapshots
+        self._refreshed_at = {
+            (database_name, table_name): refreshed_at
+            for database_name, table_name, refreshed_at in self.connection.execute(
+                "SELECT database_name, table_name, refreshed_at FROM _snapshots"
+            ).fetchall()
+        }
+        self._query_counts = Counter(
+            {
+                (database_name, table_name): queries
+                for database_name, table_name, queries in self.connection.execute(
+                    "SELECT database_name, table_name, queries FROM _table_queries"
+                ).fetchall()
+            }
+        )
+        self._counters = Counter()
+        self._stop = threading.Event()
+        self._refresher = None
+
+    def selected_tables(self) -> List[Tuple[str, str]]:
+        """Configured tables plus the most queried ones from the query log"""
+        selected = set(self.tables)
+        if self.hot_tables:
+            with self._lock:
+                ranked = self._query_counts.most_common()
+            hot = [key for key, count in ranked if count >= HOT_TABLE_MIN_QUERIES]
+            selected.update(hot[: self.hot_tables])
+        return sorted(selected)
+
+    def refresh_table(self, database_name: str, table_name: str):
+        """Copy a table into DuckDB under a staging name, then swap it in.
+
+        The copy and the swap run in one transaction, rolled back if any chunk
+        fails to load (e.g. a later chunk whose column types do not match the
+        first), so the previous snapshot stays in place.
+        """
+        engine = self.engine_factory(database_name)
+        staging = f'"{database_name}"."_staging_{table_name}"'
+        target = f'"{database_name}"."{table_name}"'
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{database_name}"')
+            started = time.time()
+            cursor.execute("BEGIN TRANSACTION")
+            try:
+                row_count = self._load_staging(cursor, engine, table_name, staging)
+                if row_count == 0:
+                    # No chunks for an empty table, nothing to route to
+                    cursor.execute("ROLLBACK")
+                    return
+                cursor.execute(f"DROP TABLE IF EXISTS {target}")
+                cursor.execute(f'ALTER TABLE {staging} RENAME TO "{table_name}"')
+                cursor.execute(
+                    "INSERT OR REPLACE INTO _snapshots VALUES (?, ?, ?, ?)",
+                    [database_name, table_name, started, row_count],
+                )
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+            with self._lock:
+                # The snapshot is as fresh as the moment the copy started
+                self._refreshed_at[(database_name, table_name)] = started
+        finally:
+            cursor.close()
+            engine.dispose()
+
+    def _load_staging(self, cursor, engine, table_name: str, staging: str) -> int:
+        """Stream the source table into the staging table chunk by chunk, returning the row count.
+
+        The staging table is created from the reflected column types, and
+        chunks are passed as object columns, so DECIMAL values and nullable
+        integers are not turned into floats on the way.
+        """
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        row_count = 0
+        with engine.connect() as connection:
+            source = Table(table_name, MetaData(), autoload_with=connection)
+            column_names = [col.name for col in source.columns]
+            cursor.execute(
+                f"CREATE TABLE {staging} ("
+                + ", ".join(f"{_quote(col.name)} {duckdb_type(col.type)}" for col in source.columns)
+                + ")"
+            )
+            result = connection.execution_options(stream_results=True).execute(select(source))
+            while True:
+                rows = result.fetchmany(SNAPSHOT_CHUNK_ROWS)
+                if not rows:
+                    break
+                chunk = pd.DataFrame([tuple(row) for row in rows], columns=column_names, dtype=object)
+                cursor.register("_chunk", chunk)
+                cursor.execute(f"INSERT INTO {staging} SELECT * FROM _chunk")
+                cursor.unregister("_chunk")
+                row_count += len(rows)
+        return row_count
+
+    def refresh(self, force: bool = False):
+        """Refresh the selected tables whose snapshot is due"""
+        now = time.time()
+        for database_name, table_name in self.selected_tables():
+            refreshed_at = self._refreshed_at.get((database_name, table_name), 0)
+            if not force and now - refreshed_at < self.refresh_s:
+                continue
+            try:
+                self.refresh_table(database_name, table_name)
+                print(f"Refreshed snapshot of {database_name}.{table_name}")
+            except Exception as e:
+                print(f"Warning: Could not refresh snapshot of {database_name}.{table_name}: {str(e)}")
+        self._save_query_counts()
+
+    def start(self):
+        """Refresh snapshots in a background thread until stop() is called"""
+        if self._refresher is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                self.refresh()
+                self._stop.wait(min(self.refresh_s, 60))
+
+        self._refresher = threading.Thread(target=run, name="acceleration-refresh", daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+    def _save_query_counts(self):
+        with self._lock:
+            counts = [
+                [database_name, table_name, queries]
+                for (database_name, table_name), queries in self._query_counts.items()
+            ]
+        if counts:
+            cursor = self.connection.cursor()
+            try:
+                cursor.executemany("INSERT OR REPLACE INTO _table_queries VALUES (?, ?, ?)", counts)
+            finally:
+                cursor.close()
+
+    def route(self, query: str, database_name: str) -> Optional[str]:
+        """Return the DuckDB SQL for a query that can be served locally, or None.
+
+        Every call counts the tables the query reads, feeding hot table selection.
+        """
+        try:
+            statement = sqlglot.parse_one(query, read=self.dialect)
+        except SqlglotError:
+            return None
+        if not isinstance(statement, exp.Query):
+            return None
+        if "nocase" in self.collation and statement.find(exp.Like, exp.ILike, exp.RegexpLike):
+            # DuckDB pattern matching is case-sensitive whatever the collation
+            return None
+
+        ctes = {cte.alias_or_name for cte in statement.find_all(exp.CTE)}
+        tables = [
+            node for node in statement.find_all(exp.Table) if node.name not in ctes
+        ]
+        if not tables:
+            return None
+
+        now = time.time()
+        eligible = True
+        with self._lock:
+            for node in tables:
+                key = (node.db or database_name, node.name)
+                self._query_counts[key] += 1
+                refreshed_at = self._refreshed_at.get(key)
+                if refreshed_at is None or now - refreshed_at > self.max_staleness_s:
+                    eligible = False
+        if not eligible:
+            return None
+
+        for node in tables:
+            # DuckDB keeps each source database in a schema of the same name
+            if not node.db:
+                node.set("db", exp.to_identifier(database_name))
+        try:
+            return statement.sql(dialect="duckdb")
+        except SqlglotError:
+            return None
+
+    def execute(self, query: str, database_name: str):
+        """Run a query on the snapshots, returning None when it must go to the source database"""
+        duckdb_query = self.route(query, database_name)
+        if duckdb_query is None:
+            with self._lock:
+                self._counters["fallback"] += 1
+            return None
+
+        cursor = self.connection.cursor()
+        try:
+            result = cursor.execute(duckdb_query)
+            columns = [description[0] for description in result.description]
+            rows = _result_rows(columns, result.fetchall())
+        except duckdb.Error as e:
+            # e.g. a function the transpiler could not map, the source database can run it
+            print(f"Warning: Could not run query on the acceleration tier: {str(e)}")
+            with self._lock:
+                self._counters["fallback"] += 1
+            return None
+        finally:
+            cursor.close()
+        with self._lock:
+            self._counters["accelerated"] += 1
+        return rows
+
+    def stats(self) -> Dict:
+        """Routed and fallback counts, and the age of each snapshot in seconds"""
+        now = time.time()
+        with self._lock:
+            return {
+                **{name: self._counters[name] for name in ("accelerated", "fallback")},
+                "snapshot_age_s": {
+                    f"{database_name}.{table_name}": round(now - refreshed_at, 1)
+                    for (database_name, table_name), refreshed_at in self._refreshed_at.items()
+                },
+            }
+
+    def close(self):
+        self.stop()
+        self._save_query_counts()
+        self.connection.close()
+
+
+def main():
+    tier = AccelerationTier()
+    print("Refreshing acceleration snapshots...")
+    tier.refresh(force=True)
+    print(tier.stats())
+    tier.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import os
+import json
+import math
+import time
+import argparse
+from pathlib import Path
+from typing import List, Dict, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+import numpy as np
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+
+load_dotenv()
+
+# flat, ivf_flat, ivf_pq, hnsw, or auto to choose by corpus size
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "auto")
+# Search-time tuning: IVF lists probed, and HNSW candidate list size
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+VECTOR_INDEX_EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64"))
+# Vectors embedded up front to train IVF centroids and PQ codebooks
+VECTOR_INDEX_TRAIN_SAMPLE = int(os.getenv("VECTOR_INDEX_TRAIN_SAMPLE", "50000"))
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# Auto selection: exact search is fast enough below the first size, HNSW's
+# full-precision vectors still fit in memory below the second, IVF-PQ beyond
+FLAT_MAX_VECTORS = 10000
+HNSW_MAX_VECTORS = 200000
+HNSW_M = 32
+# Dimensions per PQ sub-quantizer, 1536-d embeddings become 96-byte codes
+PQ_DIMENSIONS_PER_CODE = 16
+# FAISS wants at least this many training points per centroid
+TRAIN_POINTS_PER_CENTROID = 39
+
+BENCHMARK_QUERIES = 200
+BENCHMARK_K = 10
+
+
+def select_index_type(count: int, index_type: str = VECTOR_INDEX_TYPE) -> str:
+    if index_type != "auto":
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index type: {index_type}. Expected auto or one of {INDEX_TYPES}")
+        return index_type
+    if count <= FLAT_MAX_VECTORS:
+        return "flat"
+    if count <= HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf_pq"
+
+
+def factory_string(index_type: str, count: int, dimension: int, train_count: int = None) -> str:
+    """FAISS index_factory description for the index type and corpus size"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M},Flat"
+    # ~4 sqrt(n) lists, while keeping enough training points per list
+    train_count = count if train_count is None else train_count
+    nlist = max(1, min(int(4 * math.sqrt(count)), train_count // TRAIN_POINTS_PER_CENTROID))
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    codes = max(
+        m for m in range(1, dimension // PQ_DIMENSIONS_PER_CODE + 1) if dimension % m == 0
+    )
+    return f"IVF{nlist},PQ{codes}x8"
+
+
+def set_search_params(
+    index, nprobe: int = VECTOR_INDEX_NPROBE, ef_search: int = VECTOR_INDEX_EF_SEARCH
+):
+    """Apply the search-time parameters that the index type supports"""
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+    index = faiss.downcast_index(index)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+class ANNIndexBuilder:
+    """Build a FAISS vector store of a configurable index type.
+
+    Documents are embedded in batches and added as they come, so the raw
+    vectors of a large corpus are never all held in memory. Indexes that
+    need training are trained first on a random sample of the documents.
+    While adding, the exact top-k of a sample of query vectors is kept up
+    to date, and saved with the index as ground truth for benchmark().
+    The queries are documents of the corpus, each held out of its own
+    ground truth and results, otherwise it would be its own nearest
+    neighbour and inflate recall.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        index_type: str = VECTOR_INDEX_TYPE,
+        train_sample: int = VECTOR_INDEX_TRAIN_SAMPLE,
+        batch_size: int = 512,
+        benchmark_queries: int = BENCHMARK_QUERIES,
+        seed: int = 0,
+    ):
+        self.embeddings = embeddings
+        self.index_type = index_type
+        self.train_sample = train_sample
+        self.batch_size = batch_size
+        self.benchmark_queries = benchmark_queries
+        self.rng = np.random.default_rng(seed)
+
+    def _embed(self, documents: List[Document]) -> np.ndarray:
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _batches(self, items: List, size: int) -> Iterable[List]:
+        for start in range(0, len(items), size):
+            yield items[start : start + size]
+
+    def build(self, documents: List[Document], ids: List[str]) -> Tuple[FAISS, Dict]:
+        """Return the vector store and the benchmark ground truth"""
+        if not documents:
+            raise ValueError("No documents to index")
+        count = len(documents)
+        index_type = select_index_type(count, self.index_type)
+
+        order = self.rng.permutation(count)
+        sample_size = min(count, max(self.train_sample, self.benchmark_queries))
+        # Documents embedded first: the training sample, which also provides the queries
+        first = order[:sample_size]
+        rest = np.sort(order[sample_size:])
+        sample_vectors = self._embed([documents[i] for i in first])
+        dimension = sample_vectors.shape[1]
+
+        factory = factory_string(index_type, count, dimension, sample_size)
+        index = faiss.index_factory(dimension, factory)
+        if not index.is_trained:
+            print(f"Training {index_type} index on {len(sample_vectors)} vectors...")
+            index.train(sample_vectors)
+        set_search_params(index)
+
+        store = FAISS(self.embeddings, index, InMemoryDocstore(), {})
+        queries = sample_vectors[: min(self.benchmark_queries, sample_size)]
+        # The sample is added first, so query i is stored under id i
+        query_ids = np.arange(len(queries))
+        truth_distances = np.full((len(queries), BENCHMARK_K), np.inf, dtype=np.float32)
+        truth_ids = np.full((len(queries), BENCHMARK_K), -1, dtype=np.int64)
+        exact_seconds = 0.0
+
+        def add(positions, vectors):
+            nonlocal truth_distances, truth_ids, exact_seconds
+            offset = store.index.ntotal
+            store.add_embeddings(
+                [(documents[i].page_content, vector) for i, vector in zip(positions, vectors)],
+                metadatas=[documents[i].metadata for i in positions],
+                ids=[ids[i] for i in positions],
+            )
+            # Merge the batch's exact neighbours into the running top-k
+            k = min(BENCHMARK_K + 1, len(vectors))
+            started = time.perf_counter()
+            distances, labels = faiss.knn(queries, vectors, k)
+            exact_seconds += time.perf_counter() - started
+            distances[labels + offset == query_ids[:, None]] = np.inf
+            merged_distances = np.concatenate([truth_distances, distances], axis=1)
+            merged_ids = np.concatenate([truth_ids, labels + offset], axis=1)
+            best = np.argsort(merged_distances, axis=1)[:, :BENCHMARK_K]
+            truth_distances = np.take_along_axis(merged_distances, best, axis=1)
+            truth_ids = np.take_along_axis(merged_ids, best, axis=1)
+
+        for start in range(0, sample_size, self.batch_size):
+            add(first[start : start + self.batch_size], sample_vectors[start : start + self.batch_size])
+        for positions in self._batches(list(rest), self.batch_size):
+            add(positions, self._embed([documents[i] for i in positions]))
+
+        ground_truth = {
+            "index_type": index_type,
+            "factory": factory,
+            "count": count,
+            # Brute force over every batch for all queries at once, compared with
+            # the batched mean of the approximate index
+            "exact_ms": round(exact_seconds * 1000 / len(queries), 3),
+            "queries": queries,
+            "query_ids": query_ids,
+            "truth": truth_ids,
+        }
+        return store, ground_truth
+
+    @staticmethod
+    def save(store: FAISS, ground_truth: Dict, path: str):
+        store.save_local(path)
+        np.save(Path(path) / "benchmark_queries.npy", ground_truth["queries"])
+        np.save(Path(path) / "benchmark_truth.npy", ground_truth["truth"])
+        np.save(Path(path) / "benchmark_query_ids.npy", ground_truth["query_ids"])
+        with open(Path(path) / "index_info.json", "w") as f:
+            json.dump(
+                {key: ground_truth[key] for key in ("index_type", "factory", "count", "exact_ms")},
+                f,
+                indent=2,
+            )
+
+
+def benchmark(
+    path: str,
+    nprobes: Optional[List[int]] = None,
+    ef_searches: Optional[List[int]] = None,
+    k: int = BENCHMARK_K,
+) -> List[Dict]:
+    """Recall@k and latency of a saved index for each search setting, versus exact search"""
+    index = faiss.read_index(str(Path(path) / "index.faiss"))
+    queries = np.load(Path(path) / "benchmark_queries.npy")
+    truth = np.load(Path(path) / "benchmark_truth.npy")[:, :k]
+    query_ids_path = Path(path) / "benchmark_query_ids.npy"
+    # Indexes saved before queries were held out have no ids to exclude
+    query_ids = np.load(query_ids_path) if query_ids_path.exists() else np.full(len(queries), -1)
+
+    settings = [{"nprobe": None, "efSearch": None}]
+    try:
+        faiss.extract_index_ivf(index)
+        settings = [{"nprobe": n, "efSearch": None} for n in nprobes or [1, 4, 16, 64, 256]]
+    except RuntimeError:
+        if hasattr(faiss.downcast_index(index), "hnsw"):
+            settings = [{"nprobe": None, "efSearch": e} for e in ef_searches or [16, 32, 64, 128, 256]]
+
+    results = []
+    for setting in settings:
+        set_search_params(
+            index,
+            nprobe=setting["nprobe"] or VECTOR_INDEX_NPROBE,
+            ef_search=setting["efSearch"] or VECTOR_INDEX_EF_SEARCH,
+        )
+        results.append({**setting, **_measure(index, queries, query_ids, truth, k)})
+    return results
+
+
+def _measure(index, queries: np.ndarray, query_ids: np.ndarray, truth: np.ndarray, k: int) -> Dict:
+    # Batched like the exact search timed at build time, for a like-for-like mean
+    started = time.perf_counter()
+    index.search(queries, k + 1)
+    mean_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    latencies, hits = [], 0
+    for query, query_id, expected in zip(queries, query_ids, truth):
+        started = time.perf_counter()
+        _, labels = index.search(query[None, :], k + 1)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = [label for label in labels[0] if label != query_id][:k]
+        hits += len(set(found) & set(expected[expected >= 0]))
+    return {
+        "recall": round(hits / max(int((truth >= 0).sum()), 1), 4),
+        "mean_ms": round(mean_ms, 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall and latency of a vector index")
+    parser.add_argument("--index", type=str, default="fs_cache/column_index", help="Index directory")
+    parser.add_argument("--nprobe", type=int, nargs="+", help="IVF lists probed, e.g. 1 4 16 64")
+    parser.add_argument("--ef-search", type=int, nargs="+", help="HNSW efSearch values, e.g. 16 64 256")
+    parser.add_argument("--k", type=int, default=BENCHMARK_K)
+    args = parser.parse_args()
+
+    with open(Path(args.index) / "index_info.json", "r") as f:
+        info = json.load(f)
+    print(f"Index {info['factory']} ({info['index_type']}) with {info['count']} vectors, recall@{args.k} vs exact search")
+    print(f"{'exact':<14} recall=1.000  mean={info['exact_ms']:.3f} ms")
+    for result in benchmark(args.index, args.nprobe, args.ef_search, args.k):
+        setting = ", ".join(f"{key}={value}" for key, value in result.items() if key in ("nprobe", "efSearch") and value)
+        print(
+            f"{setting or 'as built':<14} recall={result['recall']:.3f}  mean={result['mean_ms']:.3f} ms  "
+            f"single query p50={result['p50_ms']:.3f} ms  p95={result['p95_ms']:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
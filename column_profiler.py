@@ -0,0 +1,269 @@
+import os
+import math
+import random
+import hashlib
+import datetime
+from decimal import Decimal
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from dotenv import load_dotenv
+from sqlalchemy import column, func, select, table, tablesample, text
+from query_executor import set_statement_timeout
+
+load_dotenv()
+
+# Cost caps for profiling: rows returned per table, and a timeout for samples
+# that still scan the table (MySQL's RAND() filter on tables without an integer key)
+PROFILE_SAMPLE_SIZE = int(os.getenv("PROFILE_SAMPLE_SIZE", "10000"))
+PROFILE_STATEMENT_TIMEOUT_MS = int(os.getenv("PROFILE_STATEMENT_TIMEOUT_MS", "5000"))
+PROFILE_MAX_WORKERS = int(os.getenv("PROFILE_MAX_WORKERS", "4"))
+
+# Only columns with at most this many distinct values get their top values stored
+TOP_VALUES_MAX_CARDINALITY = 25
+# Random primary key ranges read per sample, each an index range scan
+KEY_SAMPLE_BLOCKS = 20
+TOP_VALUES_K = 10
+MAX_VALUE_LENGTH = 60
+
+# Column types whose values are not worth listing or ranging
+UNRANKED_TYPES = ("BLOB", "BINARY", "TEXT", "JSON", "BYTEA", "GEOMETRY")
+INTEGER_TYPES = ("INT", "SERIAL")
+
+
+class HyperLogLog:
+    """Approximate distinct counter with a fixed memory footprint of 2^precision registers"""
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(self.num_registers)
+
+    def add(self, value):
+        digest = hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+def _to_json_value(value):
+    """Render a database value as a compact JSON-serialisable value"""
+    if isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    value = str(value)
+    if len(value) > MAX_VALUE_LENGTH:
+        value = value[: MAX_VALUE_LENGTH - 3] + "..."
+    return value
+
+
+class ColumnProfiler:
+    """Profile table columns from a bounded sample of rows"""
+
+    def __init__(
+        self,
+        engine,
+        sample_size: int = PROFILE_SAMPLE_SIZE,
+        statement_timeout_ms: int = PROFILE_STATEMENT_TIMEOUT_MS,
+        max_workers: int = PROFILE_MAX_WORKERS,
+    ):
+        self.engine = engine
+        self.sample_size = sample_size
+        self.statement_timeout_ms = statement_timeout_ms
+        self.max_workers = max_workers
+
+    def _estimated_rows(self, connection, table_name: str) -> Optional[int]:
+        """Row count from the database statistics, without counting, or None if unknown"""
+        dialect = connection.dialect.name
+        if dialect == "mysql":
+            query = text(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name"
+            )
+        elif dialect == "postgresql":
+            # reltuples is -1 for tables that were never analyzed
+            query = text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table_name)")
+        else:
+            return None
+        try:
+            estimate = connection.execute(query, {"table_name": table_name}).scalar()
+        except Exception:
+            return None
+        return int(estimate) if estimate is not None and estimate >= 0 else None
+
+    @staticmethod
+    def _integer_key(columns: List[Dict]) -> Optional[str]:
+        """Name of a single-column integer primary key, or None"""
+        keys = [col for col in columns if col.get("COLUMN_KEY") == "PRI"]
+        if len(keys) == 1 and any(kind in keys[0]["DATA_TYPE"].upper() for kind in INTEGER_TYPES):
+            return keys[0]["COLUMN_NAME"]
+        return None
+
+    def _key_range_sample(self, connection, table_name: str, column_names: List[str], key: str) -> List:
+        """Read short runs of rows starting at random primary key values.
+
+        Every run is an index range scan, so the cost does not grow with the
+        table size, unlike a RAND() filter that reads every row.
+        """
+        columns = [column(name) for name in column_names]
+        low, high = connection.execute(
+            select(func.min(column(key)), func.max(column(key))).select_from(table(table_name))
+        ).one()
+        if low is None:
+            return []
+        run_length = math.ceil(self.sample_size / KEY_SAMPLE_BLOCKS)
+        key_position = column_names.index(key)
+        rows = {}
+        for start in sorted(random.randint(low, high) for _ in range(KEY_SAMPLE_BLOCKS)):
+            query = (
+                select(*columns)
+                .select_from(table(table_name))
+                .where(column(key) >= start)
+                .order_by(column(key))
+                .limit(run_length)
+            )
+            for row in connection.execute(query).fetchall():
+                # Runs starting in the same gap of the key overlap
+                rows[row[key_position]] = row
+        return list(rows.values())
+
+    def _sample_rows(self, connection, table_name: str, columns: List[Dict], estimated_rows: Optional[int]):
+        """Select a random sample of about sample_size rows spread over the whole table.
+
+        A plain LIMIT would read the first rows in storage or key order, e.g.
+        only the oldest dates. Small tables are read whole, up to 2x
+        sample_size rows in case their statistics are stale.
+
+        Returns the rows and whether they are a sample rather than the whole table.
+        """
+        column_names = [col["COLUMN_NAME"] for col in columns]
+        selected = [column(name) for name in column_names]
+        limit = 2 * self.sample_size
+        if estimated_rows is not None and estimated_rows <= self.sample_size:
+            rows = connection.execute(select(*selected).select_from(table(table_name)).limit(limit)).fetchall()
+            # Fewer rows than the limit means the whole table was read
+            return rows, len(rows) >= limit
+        dialect = connection.dialect.name
+        fraction = min(1.0, self.sample_size / estimated_rows) if estimated_rows else None
+        if dialect == "postgresql" and fraction:
+            # Block-level sampling, only the sampled pages are read
+            sampled = tablesample(table(table_name), func.system(100 * fraction))
+            return connection.execute(select(*selected).select_from(sampled).limit(limit)).fetchall(), True
+        key = self._integer_key(columns)
+        if key is not None and fraction:
+            return self._key_range_sample(connection, table_name, column_names, key), True
+        if dialect == "mysql" and fraction:
+            query = select(*selected).select_from(table(table_name)).where(func.rand() < fraction).limit(limit)
+            return connection.execute(query).fetchall(), True
+        # No statistics to size a fraction from, shuffle the whole table
+        shuffle = func.rand() if dialect == "mysql" else func.random()
+        query = select(*selected).select_from(table(table_name)).order_by(shuffle).limit(self.sample_size)
+        rows = connection.execute(query).fetchall()
+        return rows, len(rows) >= self.sample_size
+
+    def profile_table(self, table_name: str, columns: List[Dict]) -> Dict[str, Dict]:
+        """Return a profile per column name, or an empty dict if sampling fails"""
+        try:
+            with self.engine.connect() as connection:
+                set_statement_timeout(connection, self.statement_timeout_ms)
+                estimated_rows = self._estimated_rows(connection, table_name)
+                rows, sampled = self._sample_rows(connection, table_name, columns, estimated_rows)
+        except Exception as e:
+            print(f"Warning: Could not profile table {table_name}: {str(e)}")
+            return {}
+
+        profiles = {}
+        for position, col in enumerate(columns):
+            values = [row[position] for row in rows]
+            profiles[col["COLUMN_NAME"]] = self.profile_values(
+                values, col["DATA_TYPE"], sampled
+            )
+        return profiles
+
+    def profile_values(self, values: List, data_type: str, sampled: bool = True) -> Dict:
+        """Compute cardinality, null fraction, min/max and top values for a sample.
+
+        ``sampled`` is False when the values are the whole table, so the
+        distinct count, min/max and top values are those of the table.
+        """
+        non_null = [value for value in values if value is not None]
+        ranked = not any(kind in data_type.upper() for kind in UNRANKED_TYPES)
+
+        hll = HyperLogLog()
+        for value in non_null:
+            hll.add(value)
+        # The HLL estimate can slightly exceed the number of values it has seen
+        approx_distinct = min(hll.count(), len(non_null))
+
+        profile = {
+            "sampleSize": len(values),
+            "sampled": sampled,
+            "approxDistinct": approx_distinct,
+            "nullFraction": round(1 - len(non_null) / len(values), 4) if values else 0.0,
+        }
+
+        if ranked and non_null:
+            try:
+                profile["min"] = _to_json_value(min(non_null))
+                profile["max"] = _to_json_value(max(non_null))
+            except TypeError:
+                pass
+
+            if approx_distinct <= TOP_VALUES_MAX_CARDINALITY:
+                profile["topValues"] = [
+                    {"value": _to_json_value(value), "count": count}
+                    for value, count in Counter(non_null).most_common(TOP_VALUES_K)
+                ]
+
+        return profile
+
+    def profile_tables(self, table_columns: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+        """Profile several tables in parallel, returning profiles per table name"""
+        if not table_columns:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                table_name: executor.submit(self.profile_table, table_name, columns)
+                for table_name, columns in table_columns.items()
+            }
+            return {table_name: future.result() for table_name, future in futures.items()}
+
+
+def format_column_profile(profile: Optional[Dict]) -> str:
+    """Render a column profile as a short DDL comment fragment.
+
+    Statistics of sampled profiles are labelled as such: values missing from
+    the sample may still exist in the table.
+    """
+    if not profile:
+        return ""
+    # Profiles written before the flag existed came from the first rows, not the whole table
+    sampled = profile.get("sampled", True)
+    distinct = f"~{profile['approxDistinct']} distinct"
+    if sampled:
+        distinct += f" in a {profile['sampleSize']}-row sample"
+    parts = [distinct]
+    if profile.get("nullFraction"):
+        parts.append(f"{profile['nullFraction']:.0%} null")
+    if "topValues" in profile:
+        values = ", ".join(repr(item["value"]) for item in profile["topValues"])
+        parts.append(f"{'sampled values' if sampled else 'values'}: {values}")
+    elif "min" in profile:
+        parts.append(f"{'sampled range' if sampled else 'range'}: {profile['min']!r}..{profile['max']!r}")
+    return f"[{'; '.join(parts)}]"
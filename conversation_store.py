@@ -0,0 +1,420 @@
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+from dotenv import load_dotenv
+from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from result_encoder import count_tokens
+
+load_dotenv()
+
+CONVERSATION_PATH = os.getenv("CONVERSATION_PATH", "fs_cache/conversations/checkpoints.sqlite")
+# Threads idle for longer than this are deleted
+CONVERSATION_TTL_S = float(os.getenv("CONVERSATION_TTL_S", "86400"))
+# Least recently used threads are deleted beyond this many
+CONVERSATION_MAX_THREADS = int(os.getenv("CONVERSATION_MAX_THREADS", "1000"))
+# Checkpoints kept per thread, older ones are only needed to replay past steps
+CONVERSATION_MAX_CHECKPOINTS = int(os.getenv("CONVERSATION_MAX_CHECKPOINTS", "10"))
+# Tokens the message history may take before old tool outputs are compacted
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "8000"))
+
+# Expiry and LRU eviction run at most this often, on writes
+EVICTION_INTERVAL_S = 60
+COMPACTED_PREVIEW_CHARS = 200
+
+
+def _thread_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """Persist agent conversation state in a local SQLite file.
+
+    Unlike MemorySaver, nothing is held in process memory, and the store
+    stays bounded: threads idle for longer than the TTL are deleted, the
+    least recently used threads are deleted beyond max_threads, and only
+    the latest max_checkpoints checkpoints of each thread are kept.
+    """
+
+    def __init__(
+        self,
+        path: str = CONVERSATION_PATH,
+        ttl_s: float = CONVERSATION_TTL_S,
+        max_threads: int = CONVERSATION_MAX_THREADS,
+        max_checkpoints: int = CONVERSATION_MAX_CHECKPOINTS,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.ttl_s = ttl_s
+        self.max_threads = max_threads
+        self.max_checkpoints = max_checkpoints
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # One connection shared by the agent's threads, serialized by the lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._last_eviction = 0.0
+        with self._lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_checkpoint_id TEXT, "
+                "type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+                "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS writes ("
+                "thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER, "
+                "channel TEXT, type TEXT, value BLOB, task_path TEXT, "
+                "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, last_access REAL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access)"
+            )
+
+    def _touch(self, thread_id: str):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time())
+        )
+
+    def _is_expired(self, thread_id: str) -> bool:
+        row = self.connection.execute(
+            "SELECT last_access FROM threads WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        return row is not None and time.time() - row[0] > self.ttl_s
+
+    def _delete_threads(self, thread_ids: List[str]):
+        for table in ("checkpoints", "writes", "threads"):
+            self.connection.executemany(
+                f"DELETE FROM {table} WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids]
+            )
+
+    def evict(self) -> int:
+        """Delete expired threads and the least recently used ones beyond max_threads"""
+        with self._lock, self.connection:
+            return self._evict()
+
+    def _evict(self) -> int:
+        self._last_eviction = time.time()
+        expired = [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT thread_id FROM threads WHERE last_access < ?", (time.time() - self.ttl_s,)
+            )
+        ]
+        self._delete_threads(expired)
+        overflow = [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT thread_id FROM threads ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                (self.max_threads,),
+            )
+        ]
+        self._delete_threads(overflow)
+        return len(expired) + len(overflow)
+
+    def _load_tuple(self, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        writes = self.connection.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config=_thread_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                _thread_config(thread_id, checkpoint_ns, parent_checkpoint_id)
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, channel, value_type, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock, self.connection:
+            if self._is_expired(thread_id):
+                # Expired but not evicted yet, the conversation starts over
+                self._delete_threads([thread_id])
+                return None
+            columns = (
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                "type, checkpoint, metadata_type, metadata FROM checkpoints "
+            )
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.connection.execute(
+                    columns + "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.connection.execute(
+                    columns + "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            self._touch(thread_id)
+            return self._load_tuple(row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "type, checkpoint, metadata_type, metadata FROM checkpoints WHERE 1 = 1"
+        )
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_checkpoint_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_checkpoint_id)
+        query += " ORDER BY checkpoint_id DESC"
+
+        # Loaded up front, the lock is not held while the caller iterates
+        with self._lock:
+            tuples = [self._load_tuple(row) for row in self.connection.execute(query, params).fetchall()]
+        for checkpoint_tuple in tuples:
+            if filter and not all(
+                checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()
+            ):
+                continue
+            if limit is not None:
+                if limit <= 0:
+                    break
+                limit -= 1
+            yield checkpoint_tuple
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, serialized = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    serialized,
+                    metadata_type,
+                    serialized_metadata,
+                ),
+            )
+            # Each checkpoint holds the whole state, older ones are pruned
+            self.connection.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT ?)",
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.max_checkpoints),
+            )
+            self.connection.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)",
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns),
+            )
+            self._touch(thread_id)
+            if time.time() - self._last_eviction > EVICTION_INTERVAL_S:
+                self._evict()
+        return _thread_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, serialized = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint_id,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    serialized,
+                    task_path,
+                )
+            )
+        with self._lock, self.connection:
+            # Special writes (errors, interrupts) replace earlier ones, regular writes are kept once
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for row in rows if row[4] < 0],
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for row in rows if row[4] >= 0],
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self.connection:
+            self._delete_threads([thread_id])
+
+    # The SQLite calls are local and short, the async API runs them inline like MemorySaver
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for checkpoint_tuple in self.list(config, filter=filter, before=before, limit=limit):
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+def _message_tokens(message: AnyMessage) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content) + sum(
+        count_tokens(str(call.get("args", ""))) for call in getattr(message, "tool_calls", None) or []
+    )
+
+
+def compact_tool_message(message: ToolMessage) -> ToolMessage:
+    """Replace a tool output with a short summary, keeping its id so it replaces the original in the state"""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    preview = content.strip().split("\n")[0]
+    if len(preview) > COMPACTED_PREVIEW_CHARS:
+        preview = preview[: COMPACTED_PREVIEW_CHARS - 3] + "..."
+    return ToolMessage(
+        content=f"[Earlier {message.name or 'tool'} output compacted, was {count_tokens(content)} tokens] {preview}",
+        tool_call_id=message.tool_call_id,
+        name=message.name,
+        id=message.id,
+        status=message.status,
+        additional_kwargs={**message.additional_kwargs, "compacted": True},
+    )
+
+
+class HistoryCompactor:
+    """pre_model_hook for create_react_agent that keeps the message history within a token budget.
+
+    Once the history exceeds the budget, the outputs of tool calls from
+    earlier turns (SQL results, DDL) are replaced, oldest first, with a one
+    line summary until it fits again. Tool outputs of the current turn, the
+    ones after the latest human message, are never compacted. The compacted
+    messages replace the originals in the state, so the checkpointed history
+    stays bounded as well as the prompt.
+    """
+
+    def __init__(self, token_budget: int = CONVERSATION_TOKEN_BUDGET):
+        self.token_budget = token_budget
+
+    def compact(self, messages: List[AnyMessage]) -> List[ToolMessage]:
+        """Return the compacted replacements for old tool messages, empty when within budget"""
+        total = sum(_message_tokens(message) for message in messages)
+        if total <= self.token_budget:
+            return []
+        current_turn = max(
+            (position for position, message in enumerate(messages) if isinstance(message, HumanMessage)),
+            default=len(messages),
+        )
+        replacements = []
+        for message in messages[:current_turn]:
+            if total <= self.token_budget:
+                break
+            if not isinstance(message, ToolMessage) or message.additional_kwargs.get("compacted"):
+                continue
+            compacted = compact_tool_message(message)
+            total -= _message_tokens(message) - _message_tokens(compacted)
+            replacements.append(compacted)
+        return replacements
+
+    def __call__(self, state: Dict) -> Dict:
+        messages = state["messages"]
+        replacements = {message.id: message for message in self.compact(messages)}
+        if not replacements:
+            return {"llm_input_messages": messages}
+        return {
+            # Merged by id into the state, replacing the full tool outputs
+            "messages": list(replacements.values()),
+            "llm_input_messages": [replacements.get(message.id, message) for message in messages],
+        }
@@ -0,0 +1,89 @@
+import json
+from pathlib import Path
+from typing import List, Dict
+from column_profiler import format_column_profile
+
+
+def load_relationships(relationships_path: str = "fs_cache/relationships") -> List[Dict]:
+    """Load all relationship files generated by SemanticRelationshipGenerator"""
+    relationships = []
+    for file_path in Path(relationships_path).glob("*.json"):
+        with open(file_path, "r") as f:
+            relationships.append(json.load(f))
+    return relationships
+
+
+def generate_ddl_for_models_and_relationships(model_relationships):
+    """Render CREATE TABLE statements and foreign keys for the retrieved models"""
+    # Build a lookup for model name -> (db, columns)
+    model_lookup = {}
+    for entry in model_relationships:
+        model = entry["model"]
+        model_lookup[model["name"]] = {
+            "db": model["database"],
+            "columns": {col["name"]: col for col in model["columns"]},
+        }
+
+    ddls = []
+    for entry in model_relationships:
+        model = entry["model"]
+        table_name = model["name"]
+        db_name = model["database"]
+        columns = model["columns"]
+        table_desc = model.get("properties", {}).get("description", "")
+        pk_candidates = [
+            col["name"]
+            for col in columns
+            if col["name"].lower().endswith("id") and col.get("notNull", 0)
+        ]
+        # Compose DDL
+        ddl_lines = []
+        ddl_lines.append(f"-- Table: {db_name}.{table_name}")
+        if table_desc:
+            ddl_lines.append(f"-- Description: {table_desc}")
+        ddl_lines.append(f"CREATE TABLE {db_name}.{table_name} (")
+        col_lines = []
+        for col in columns:
+            col_name = col["name"]
+            col_type = col["type"]
+            not_null = "NOT NULL" if col.get("notNull", 0) else ""
+            desc = col.get("properties", {}).get("description", "")
+            # Inline the ingestion-time profile, e.g. the values of status columns
+            profile = format_column_profile(col.get("profile"))
+            comment_text = " ".join(part for part in (desc, profile) if part)
+            comment = f" -- {comment_text}" if comment_text else ""
+            col_lines.append(f"    {col_name} {col_type} {not_null}{comment}".rstrip())
+        # Add primary key if any
+        if pk_candidates:
+            pk = pk_candidates[0]
+            col_lines.append(f"    ,PRIMARY KEY ({pk})")
+        # Add the indexes captured at ingestion
+        for index in model.get("indexes", []):
+            unique = "UNIQUE " if index.get("unique") else ""
+            col_lines.append(f"    {unique}INDEX {index['name']} ({', '.join(index['columns'])})")
+        ddl_lines.append(",\n".join(col_lines))
+        ddl_lines.append(");")
+        ddls.append("\n".join(ddl_lines))
+
+    # Now generate foreign key constraints
+    fk_lines = []
+    for entry in model_relationships:
+        relationships = entry.get("relationships", [])
+        for rel in relationships:
+            # Parse the join condition: "table1.col1 = table2.col2"
+            cond = rel.get("condition", "")
+            if "=" not in cond:
+                continue
+            left, right = [x.strip() for x in cond.split("=")]
+            left_table, left_col = left.split(".")
+            right_table, right_col = right.split(".")
+            # Only add FK if both tables are in the model_lookup
+            if left_table in model_lookup and right_table in model_lookup:
+                # Try to add FK from left_table to right_table
+                fk_lines.append(
+                    f"ALTER TABLE {model_lookup[left_table]['db']}.{left_table}\n"
+                    f"    ADD FOREIGN KEY ({left_col}) REFERENCES {model_lookup[right_table]['db']}.{right_table}({right_col});"
+                )
+                # For MANY_TO_MANY, you might want to add both directions, but usually only one is needed
+
+    return "\n\n".join(ddls + fk_lines)
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import datetime
+from decimal import Decimal
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Sequence
+from dotenv import load_dotenv
+import numpy as np
+import sqlglot
+from sqlglot import exp
+
+load_dotenv()
+
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "4"))
+EVAL_MAX_RETRIES = int(os.getenv("EVAL_MAX_RETRIES", "2"))
+
+STAGES = ("retrieval_ms", "generation_ms", "validation_ms", "execution_ms", "total_ms")
+PERCENTILES = (50, 95, 99)
+# Generated and gold SQL are written in MySQL syntax, see SQLGenerator
+SOURCE_DIALECT = "mysql"
+
+
+def load_questions(path: str) -> List[Dict]:
+    """Read questions as JSONL: {"id", "question", "gold_sql" or "gold_result", optional "database"}"""
+    questions = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "question" not in item or not ("gold_sql" in item or "gold_result" in item):
+                raise ValueError(
+                    f"Invalid question on line {line_number}: expected 'question' and 'gold_sql' or 'gold_result'"
+                )
+            item.setdefault("id", str(line_number))
+            questions.append(item)
+    return questions
+
+
+def normalize_value(value):
+    """Make values from different drivers and JSON comparable"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (Decimal, float)):
+        return round(float(value), 4)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return value
+
+
+def result_multiset(rows: Sequence) -> Counter:
+    """Rows as a multiset, so results compare regardless of row order"""
+    return Counter(tuple(normalize_value(value) for value in row) for row in rows)
+
+
+class Evaluator:
+    """Run questions end to end (retrieval, generation, validation, execution) and score them.
+
+    Each question follows the generate_sql_query tool path: retrieve the
+    context for the question, generate SQL, regenerate with the validator's
+    or the database's feedback up to max_retries times, then execute. The
+    result is compared order-insensitively with the gold result set, or with
+    the result of the gold SQL. Questions run concurrently on a bounded pool.
+    """
+
+    def __init__(
+        self,
+        retriever,
+        generator,
+        validator,
+        executor,
+        semantic_context: str = "",
+        max_retries: int = EVAL_MAX_RETRIES,
+        workers: int = EVAL_WORKERS,
+    ):
+        self.retriever = retriever
+        self.generator = generator
+        self.validator = validator
+        self.executor = executor
+        self.semantic_context = semantic_context
+        self.max_retries = max_retries
+        self.workers = workers
+        self.target_dialect = executor.connection_url_template.get_backend_name()
+
+    def to_target_dialect(self, query: str) -> str:
+        """Transpile MySQL to SQLite for offline runs, where each database is its own file"""
+        if self.target_dialect != "sqlite":
+            return query
+        statement = sqlglot.parse_one(query, read=SOURCE_DIALECT)
+        for table in statement.find_all(exp.Table):
+            table.set("db", None)
+        return statement.sql(dialect="sqlite")
+
+    def execute(self, query: str, database_name: str, thread_id: str):
+        return self.executor.execute(self.to_target_dialect(query), database_name, thread_id)
+
+    def run_question(self, item: Dict) -> Dict:
+        question = item["question"]
+        thread_id = f"eval-{item['id']}"
+        latency = dict.fromkeys(STAGES, 0.0)
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        record = {"id": item["id"], "question": question, "sql": None, "retries": 0, "error": None}
+        started = time.perf_counter()
+
+        try:
+            stage_started = time.perf_counter()
+            # The question stands in for the agent's reasoning steps
+            context = self.retriever.get_db_context(question)
+            ddl = self.retriever.get_ddl(context)
+            latency["retrieval_ms"] = (time.perf_counter() - stage_started) * 1000
+            database_name = item.get("database") or (
+                context[0]["model"]["database"] if context else None
+            )
+            record["database"] = database_name
+
+            rows, feedback = None, None
+            for attempt in range(self.max_retries + 1):
+                record["retries"] = attempt
+                stage_started = time.perf_counter()
+                query = self.generator.generate(
+                    ddl, question, self.semantic_context, question, feedback, usage=usage
+                )
+                latency["generation_ms"] += (time.perf_counter() - stage_started) * 1000
+                record["sql"] = query
+                if query == "No information found" or database_name is None:
+                    feedback = "No information found"
+                    break
+
+                stage_started = time.perf_counter()
+                validation = self.validator.validate(query)
+                latency["validation_ms"] += (time.perf_counter() - stage_started) * 1000
+                if not validation["valid"]:
+                    feedback = self.validator.format_feedback(query, validation)
+                    continue
+                query = record["sql"] = validation["sql"]
+
+                stage_started = time.perf_counter()
+                try:
+                    result = self.execute(query, database_name, thread_id)
+                except Exception as e:
+                    result = f"Query failed: {str(e)}"
+                latency["execution_ms"] += (time.perf_counter() - stage_started) * 1000
+                if isinstance(result, str):
+                    feedback = result
+                    continue
+                rows, feedback = result, None
+                break
+
+            if rows is None:
+                record["error"] = feedback
+                record["correct"] = False
+            else:
+                record["rows"] = len(rows)
+                record["correct"] = result_multiset(rows) == result_multiset(
+                    self.gold_result(item, database_name, thread_id)
+                )
+        except Exception as e:
+            record["error"] = str(e)
+            record["correct"] = False
+
+        latency["total_ms"] = (time.perf_counter() - started) * 1000
+        record["latency_ms"] = {stage: round(value, 1) for stage, value in latency.items()}
+        record["tokens"] = usage
+        return record
+
+    def gold_result(self, item: Dict, database_name: str, thread_id: str) -> Sequence:
+        if "gold_result" in item:
+            return item["gold_result"]
+        result = self.execute(item["gold_sql"], database_name, thread_id)
+        if isinstance(result, str):
+            raise ValueError(f"Gold SQL could not be executed: {result}")
+        return result
+
+    def run(self, questions: List[Dict]) -> List[Dict]:
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self.run_question, questions))
+
+    @staticmethod
+    def summarize(results: List[Dict], wall_s: float) -> Dict:
+        """Accuracy, retries, token totals and latency percentiles per stage"""
+        count = len(results)
+        summary = {
+            "questions": count,
+            "correct": sum(record["correct"] for record in results),
+            "errors": sum(record["error"] is not None for record in results),
+            "accuracy": round(sum(record["correct"] for record in results) / count, 4) if count else 0.0,
+            "retries": sum(record["retries"] for record in results),
+            "input_tokens": sum(record["tokens"]["input_tokens"] for record in results),
+            "output_tokens": sum(record["tokens"]["output_tokens"] for record in results),
+            "wall_s": round(wall_s, 2),
+            "latency_ms": {},
+        }
+        for stage in STAGES:
+            values = [record["latency_ms"][stage] for record in results]
+            summary["latency_ms"][stage] = {
+                f"p{q}": round(float(np.percentile(values, q)), 1) if values else 0.0
+                for q in PERCENTILES
+            }
+        return summary
+
+    @staticmethod
+    def format_report(results: List[Dict], summary: Dict) -> str:
+        lines = []
+        for record in results:
+            status = "PASS" if record["correct"] else "FAIL"
+            latency = record["latency_ms"]
+            lines.append(
+                f"{status} {record['id']}: {latency['total_ms']:.0f} ms "
+                f"(retrieval {latency['retrieval_ms']:.0f}, generation {latency['generation_ms']:.0f}, "
+                f"validation {latency['validation_ms']:.0f}, execution {latency['execution_ms']:.0f}), "
+                f"tokens {record['tokens']['input_tokens']}+{record['tokens']['output_tokens']}, "
+                f"retries {record['retries']}"
+                + (f"\n    error: {record['error']}" if record["error"] else "")
+            )
+        lines.append("")
+        lines.append(
+            f"Accuracy: {summary['correct']}/{summary['questions']} ({summary['accuracy']:.1%}), "
+            f"errors: {summary['errors']}, retries: {summary['retries']}, "
+            f"tokens: {summary['input_tokens']} in / {summary['output_tokens']} out, "
+            f"wall time: {summary['wall_s']} s"
+        )
+        for stage, percentiles in summary["latency_ms"].items():
+            lines.append(
+                f"{stage:<14} " + "  ".join(f"{name}={value:.1f}" for name, value in percentiles.items())
+            )
+        return "\n".join(lines)
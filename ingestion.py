@@ -3,58 +3,117 @@ import json
 from dotenv import load_dotenv
 from pathlib import Path
 import datetime
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.engine import URL
 import openai
+from column_profiler import ColumnProfiler
 
 load_dotenv()
 
 # Configure OpenAI
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# Databases reflected at once, and tables described by the LLM at once
+INGESTION_DATABASE_WORKERS = int(os.getenv("INGESTION_DATABASE_WORKERS", "4"))
+INGESTION_TABLE_WORKERS = int(os.getenv("INGESTION_TABLE_WORKERS", "8"))
+
+
+class IngestionCheckpoint:
+    """Durable, append-only log of the stage each table has completed.
+
+    A table is "modeled" once its model file is written and "indexed" once it
+    is persisted in the vector index. A resumed run skips indexed tables and
+    only embeds modeled ones, so no LLM description is generated twice.
+    """
+
+    MODELED = "modeled"
+    INDEXED = "indexed"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.stages = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A partially written last line from a crashed run
+                        continue
+                    self._apply(entry)
+
+    def _apply(self, entry):
+        key = (entry["database"], entry["table"])
+        if self.stages.get(key) != self.INDEXED:
+            self.stages[key] = entry["stage"]
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text("")
+
+    def record(self, tables, stage):
+        """Append (database, table) entries for a stage and flush them to disk"""
+        with self._lock:
+            with open(self.path, "a") as f:
+                for database, table in tables:
+                    entry = {
+                        "database": database,
+                        "table": table,
+                        "stage": stage,
+                        "time": datetime.datetime.now().isoformat(),
+                    }
+                    f.write(json.dumps(entry) + "\n")
+                    self._apply(entry)
+                f.flush()
+                os.fsync(f.fileno())
 
-class DatabaseIngestion:
-    def __init__(self, database_tables=None, business_context=None):
-        db_type = os.getenv("DATASOURCE_TYPE", "mysql").lower()
-        self.database_tables = database_tables or []
-        self.business_context = business_context
+    def tables(self, stage):
+        return {key for key, value in self.stages.items() if value == stage}
 
-        if db_type == "mysql":
-            self.connection_url_template = URL.create(
-                "mysql+mysqlconnector",
-                username=os.getenv("DB_USER"),
-                password=os.getenv("DB_PASS"),
-                host=os.getenv("DB_HOST"),
-                port=int(os.getenv("DB_PORT")),
-                database=None,
-            )
-        elif db_type == "postgresql":
-            self.connection_url_template = URL.create(
-                "postgresql",
-                username=os.getenv("DB_USER"),
-                password=os.getenv("DB_PASS"),
-                host=os.getenv("DB_HOST"),
-                port=int(os.getenv("DB_PORT")),
-                database=None,
-            )
-        else:
-            raise ValueError(f"Unsupported database type: {db_type}")
+    def forget_indexed(self):
+        """Mark indexed tables as only modeled again, e.g. when the index file is missing.
 
-        # Create cache directories if they don't exist
-        self.base_path = Path("fs_cache")
-        self.models_path = self.base_path / "models"
-        self.relationships_path = self.base_path / "relationships"
+        The log is rewritten, since an appended entry never downgrades a stage.
+        """
+        with self._lock:
+            self.stages = {
+                key: self.MODELED if stage == self.INDEXED else stage
+                for key, stage in self.stages.items()
+            }
+            temporary = self.path.with_suffix(".tmp")
+            with open(temporary, "w") as f:
+                for (database, table), stage in self.stages.items():
+                    f.write(json.dumps({"database": database, "table": table, "stage": stage}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
 
-        self.models_path.mkdir(parents=True, exist_ok=True)
-        self.relationships_path.mkdir(parents=True, exist_ok=True)
 
-    def connect_to_database(self, database_name):
-        # Create a new connection URL for the specific database
-        connection_url = self.connection_url_template.set(database=database_name)
+class DatabaseConnection:
+    """Pooled engine, inspector and profiler bound to a single database.
+
+    Each ingestion worker opens its own connection, so databases can be
+    reflected in parallel. The engine is disposed when the connection closes.
+    """
 
-        # Create new engine and inspector for this database
-        self.engine = create_engine(connection_url)
+    def __init__(self, connection_url_template, database_name, database_tables=None):
+        self.database_tables = database_tables or []
+        self.engine = create_engine(
+            connection_url_template.set(database=database_name), pool_pre_ping=True
+        )
         self.inspector = inspect(self.engine)
+        self.profiler = ColumnProfiler(self.engine)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def get_tables(self):
         if self.database_tables:
@@ -148,6 +207,20 @@ class DatabaseIngestion:
                 ).scalar()
                 return bool(result)
 
+    def get_indexes(self, table_name):
+        try:
+            return [
+                {
+                    "name": index["name"],
+                    "columns": [name for name in index["column_names"] if name],
+                    "unique": bool(index.get("unique")),
+                }
+                for index in self.inspector.get_indexes(table_name)
+            ]
+        except Exception:
+            # Views and some system tables have no index metadata
+            return []
+
     def get_relationships(self):
         relationships = []
         try:
@@ -191,6 +264,104 @@ class DatabaseIngestion:
 
         return relationships
 
+    def reflect(self, tables):
+        """Reflect the tables and the database relationships once, for models and relationships"""
+        table_columns = {table: self.get_columns(table) for table in tables}
+        # Profile all tables of the database in parallel
+        profiles = self.profiler.profile_tables(table_columns)
+
+        return {
+            "tables": [
+                {
+                    "database": self.engine.url.database,
+                    "name": table,
+                    "columns": columns,
+                    "indexes": self.get_indexes(table),
+                    "profiles": profiles.get(table, {}),
+                }
+                for table, columns in table_columns.items()
+            ],
+            "relationships": self.get_relationships(),
+        }
+
+    def close(self):
+        self.engine.dispose()
+
+
+class DatabaseIngestion:
+    def __init__(
+        self,
+        database_tables=None,
+        business_context=None,
+        resume=False,
+        index_path="fs_cache/vector_index",
+    ):
+        db_type = os.getenv("DATASOURCE_TYPE", "mysql").lower()
+        self.database_tables = database_tables or []
+        self.business_context = business_context
+        self.resume = resume
+
+        if db_type == "mysql":
+            self.connection_url_template = URL.create(
+                "mysql+mysqlconnector",
+                username=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASS"),
+                host=os.getenv("DB_HOST"),
+                port=int(os.getenv("DB_PORT")),
+                database=None,
+            )
+        elif db_type == "postgresql":
+            self.connection_url_template = URL.create(
+                "postgresql",
+                username=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASS"),
+                host=os.getenv("DB_HOST"),
+                port=int(os.getenv("DB_PORT")),
+                database=None,
+            )
+        else:
+            raise ValueError(f"Unsupported database type: {db_type}")
+
+        # Create cache directories if they don't exist
+        self.base_path = Path("fs_cache")
+        self.models_path = self.base_path / "models"
+        self.relationships_path = self.base_path / "relationships"
+
+        self.models_path.mkdir(parents=True, exist_ok=True)
+        self.relationships_path.mkdir(parents=True, exist_ok=True)
+
+        self.checkpoint = IngestionCheckpoint(self.base_path / "ingestion_checkpoint.jsonl")
+        if not resume:
+            self.checkpoint.reset()
+        elif not (Path(index_path) / "index.faiss").exists():
+            # The tables marked indexed are not in any index anymore, re-embed
+            # them from their model files instead of skipping them
+            self.checkpoint.forget_indexed()
+
+        self._lock = threading.Lock()
+        self._connections = set()
+
+    def connect_to_database(self, database_name):
+        # Each database gets its own engine, disposed when the connection closes
+        connection = DatabaseConnection(
+            self.connection_url_template, database_name, self.database_tables
+        )
+        with self._lock:
+            self._connections.add(connection)
+        return connection
+
+    def release_connection(self, connection):
+        connection.close()
+        with self._lock:
+            self._connections.discard(connection)
+
+    def reflect_database(self, database_name, tables):
+        connection = self.connect_to_database(database_name)
+        try:
+            return connection.reflect(tables)
+        finally:
+            self.release_connection(connection)
+
     def generate_column_description(self, table_name, column_name, data_type):
         """Generate column description using OpenAI GPT"""
         if not self.business_context:
@@ -262,20 +433,27 @@ Description should explain the business purpose of this table.
             )
             return f"Table containing {table_name} data"
 
-    def generate_model_json(self, table_name, columns):
+    def generate_model_json(self, table):
+        """Build the model of a table reflected by DatabaseConnection.reflect"""
+        table_name = table["name"]
+        # Profiled from a bounded sample so the agent doesn't need DISTINCT probes
+        profiles = table["profiles"]
+
         model = {
             "name": table_name,
-            "database": self.engine.url.database,
+            "database": table["database"],
             "columns": [],
             "refreshTime": datetime.datetime.now().isoformat(),
             "properties": {
                 "description": self.generate_table_description(table_name),
                 "displayName": table_name,
-                "database": self.engine.url.database,
+                "database": table["database"],
             },
+            # Lets the SQL generator prefer indexed columns for filters and joins
+            "indexes": table["indexes"],
         }
 
-        for column in columns:
+        for column in table["columns"]:
             column_name = column["COLUMN_NAME"]
             data_type = column["DATA_TYPE"]
 
@@ -291,6 +469,9 @@ Description should explain the business purpose of this table.
                 },
             }
 
+            if profiles.get(column_name):
+                column_info["profile"] = profiles[column_name]
+
             if column["COLUMN_KEY"] == "PRI":
                 model["primaryKey"] = column_name
 
@@ -309,52 +490,124 @@ Description should explain the business purpose of this table.
             "condition": f"{relationship['REFERENCED_TABLE_NAME']}.{relationship['REFERENCED_COLUMN_NAME']} = {relationship['TABLE_NAME']}.{relationship['COLUMN_NAME']}",
         }
 
+    def _resolve_database_tables(self):
+        if self.database_tables:
+            return self.database_tables
+        # If no specific tables provided, ingest every table of DB_NAME
+        db_name = os.getenv("DB_NAME")
+        connection = self.connect_to_database(db_name)
+        try:
+            return [(db_name, table) for table in connection.get_tables()]
+        finally:
+            self.release_connection(connection)
+
+    def stream_models(self):
+        """Yield each model as soon as it is written, for the indexing stage.
+
+        Stages: reflect -> describe -> write model. Models already on disk
+        that still need indexing (carried over from earlier runs, or modeled
+        before a resumed run stopped) are yielded first.
+        """
+        database_tables = self._resolve_database_tables()
+        yield from self._pending_models_stage(database_tables)
+        tables = self._reflect_stage(database_tables)
+        yield from self._write_stage(self._describe_stage(tables))
+
     def process(self):
-        if not self.database_tables:
-            # If no specific tables provided, use default behavior
-            self.connect_to_database(os.getenv("DB_NAME"))
-            tables = self.get_tables()
-            self._process_tables(tables)
-        else:
-            # Process each database and its tables
-            processed_dbs = set()
-            for db_name, table in self.database_tables:
-                if db_name not in processed_dbs:
-                    self.connect_to_database(db_name)
-                    processed_dbs.add(db_name)
-
-                columns = self.get_columns(table)
-                model_json = self.generate_model_json(table, columns)
-
-                with open(self.models_path / f"{db_name}_{table}.json", "w") as f:
-                    json.dump(model_json, f, indent=4)
-
-            # Process relationships after all tables are processed
-            self._process_relationships()
-
-    def _process_relationships(self):
-        # Process relationships for each database
-        processed_dbs = set()
-        for db_name, _ in self.database_tables:
-            if db_name not in processed_dbs:
-                self.connect_to_database(db_name)
-                processed_dbs.add(db_name)
-
-                relationships = self.get_relationships()
-                for idx, rel in enumerate(relationships):
-                    # Only process relationships if both tables are in our filter
-                    if self._is_relationship_relevant(rel):
-                        relationship_json = self.generate_relationship_json(rel)
-                        with open(
-                            self.relationships_path
-                            / f"{db_name}_relationship_{idx+1}.json",
-                            "w",
-                        ) as f:
-                            json.dump(relationship_json, f, indent=4)
-
-    def _is_relationship_relevant(self, relationship):
+        """Run ingestion to completion without indexing"""
+        for _ in self.stream_models():
+            pass
+
+    def _pending_models_stage(self, database_tables):
+        indexed = self.checkpoint.tables(IngestionCheckpoint.INDEXED)
+        modeled = self.checkpoint.tables(IngestionCheckpoint.MODELED)
+        run_tables = set(database_tables)
+        for file_path in sorted(self.models_path.glob("*.json")):
+            with open(file_path, "r") as f:
+                model = json.load(f)
+            key = (model["database"], model["name"])
+            if key in indexed:
+                continue
+            if key in run_tables and key not in modeled:
+                # Regenerated by this run
+                continue
+            yield model
+
+    def _reflect_stage(self, database_tables):
+        """Reflect databases in parallel, yielding tables that still need a model"""
+        done = self.checkpoint.tables(IngestionCheckpoint.INDEXED) | self.checkpoint.tables(
+            IngestionCheckpoint.MODELED
+        )
+        tables_by_db = {}
+        for db_name, table in database_tables:
+            if (db_name, table) not in done:
+                tables_by_db.setdefault(db_name, []).append(table)
+
+        with ThreadPoolExecutor(max_workers=INGESTION_DATABASE_WORKERS) as pool:
+            futures = {
+                pool.submit(self.reflect_database, db_name, tables): db_name
+                for db_name, tables in tables_by_db.items()
+            }
+            for future in as_completed(futures):
+                db_name = futures[future]
+                reflection = future.result()
+                # Reuse the reflection for the relationships instead of reconnecting
+                self._process_relationships(
+                    db_name, reflection["relationships"], database_tables
+                )
+                yield from reflection["tables"]
+
+    def _describe_stage(self, tables):
+        """Generate models on the table pool, yielding them in completion order"""
+        with ThreadPoolExecutor(max_workers=INGESTION_TABLE_WORKERS) as pool:
+            pending = set()
+            for table in tables:
+                pending.add(pool.submit(self.generate_model_json, table))
+                # Bound the work in flight so models keep flowing downstream
+                if len(pending) >= 2 * INGESTION_TABLE_WORKERS:
+                    completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+
+    def _write_stage(self, models):
+        for model_json in models:
+            self.write_model(model_json)
+            self.checkpoint.record(
+                [(model_json["database"], model_json["name"])],
+                IngestionCheckpoint.MODELED,
+            )
+            yield model_json
+
+    def mark_indexed(self, models):
+        """Record that these models are persisted in the vector index"""
+        self.checkpoint.record(
+            [(model["database"], model["name"]) for model in models],
+            IngestionCheckpoint.INDEXED,
+        )
+
+    def write_model(self, model_json):
+        with open(
+            self.models_path / f"{model_json['database']}_{model_json['name']}.json",
+            "w",
+        ) as f:
+            json.dump(model_json, f, indent=4)
+
+    def _process_relationships(self, db_name, relationships, database_tables):
+        for idx, rel in enumerate(relationships):
+            # Only process relationships if both tables are in our filter
+            if self._is_relationship_relevant(rel, database_tables):
+                relationship_json = self.generate_relationship_json(rel)
+                with open(
+                    self.relationships_path / f"{db_name}_relationship_{idx+1}.json",
+                    "w",
+                ) as f:
+                    json.dump(relationship_json, f, indent=4)
+
+    def _is_relationship_relevant(self, relationship, database_tables):
         # Check if both tables in the relationship are in our filtered list
-        table_pairs = [(db, table) for db, table in self.database_tables]
+        table_pairs = [(db, table) for db, table in database_tables]
         return any(
             (db, relationship["TABLE_NAME"]) in table_pairs
             for db in {pair[0] for pair in table_pairs}
@@ -364,8 +617,12 @@ Description should explain the business purpose of this table.
         )
 
     def close(self):
-        if hasattr(self, "engine"):
-            self.engine.dispose()
+        # Dispose engines of connections left open by a failed run
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
 
 
 if __name__ == "__main__":
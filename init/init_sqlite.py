@@ -0,0 +1,44 @@
+import os
+import random
+import sqlite3
+from pathlib import Path
+import sqlglot
+from dotenv import load_dotenv
+from init_db import create_tables, insert_demo_data
+
+# Seed the demo database as a SQLite file, for offline runs with DATASOURCE_TYPE=sqlite
+load_dotenv(override=True)
+
+
+class SQLiteCursor:
+    """Run the MySQL statements of init_db on a SQLite cursor"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, statement):
+        self.cursor.execute(sqlglot.transpile(statement, read="mysql", write="sqlite")[0])
+
+    def executemany(self, statement, rows):
+        self.cursor.executemany(statement.replace("%s", "?"), rows)
+
+
+def main():
+    path = Path(os.getenv("SQLITE_PATH", "fs_cache/sqlite")) / f"{os.getenv('DB_NAME', 'customer_db')}.db"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+
+    # Same data on every run, so gold result sets stay valid
+    random.seed(0)
+    conn = sqlite3.connect(path)
+    try:
+        create_tables(SQLiteCursor(conn.cursor()))
+        insert_demo_data(SQLiteCursor(conn.cursor()))
+        conn.commit()
+        print(f"Database initialized successfully at {path}!")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import List, Dict
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+MODES = ("record", "replay")
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a call was never recorded"""
+
+
+class LLMCassette:
+    """Record LLM and embedding calls to a JSONL file and replay them offline.
+
+    Calls are keyed by a hash of their kind, model, parameters and input. In
+    record mode every call goes to the provider and its response is appended
+    to the file; in replay mode responses come from the file only, so runs
+    need no network access or API key and are reproducible.
+    """
+
+    def __init__(self, path: str, mode: str = "replay"):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported cassette mode: {mode}. Expected one of {MODES}")
+        self.path = Path(path)
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry["response"]
+
+    @staticmethod
+    def key(kind: str, **params) -> str:
+        payload = json.dumps({"kind": kind, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def call(self, key: str, make_call) -> Dict:
+        """Return the recorded response for key, calling make_call() when recording"""
+        if self.mode == "replay":
+            with self._lock:
+                if key not in self._entries:
+                    raise CassetteMiss(
+                        f"No recorded response for call {key[:12]} in {self.path}, "
+                        "record it first with mode 'record'"
+                    )
+                return self._entries[key]
+
+        response = make_call()
+        with self._lock:
+            self._entries[key] = response
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "response": response}) + "\n")
+        return response
+
+    def chat_model(self, model: str, temperature: float):
+        """llm_factory for SQLGenerator"""
+        return CassetteChatModel(self, model, temperature)
+
+    def embeddings(self, model: str = "text-embedding-3-small") -> Embeddings:
+        return CassetteEmbeddings(self, model)
+
+
+class CassetteChatModel:
+    def __init__(self, cassette: LLMCassette, model: str, temperature: float):
+        self.cassette = cassette
+        self.model = model
+        self.temperature = temperature
+
+    def invoke(self, prompt: str) -> AIMessage:
+        def make_call():
+            from langchain_openai import ChatOpenAI
+
+            response = ChatOpenAI(model=self.model, temperature=self.temperature).invoke(prompt)
+            return {"content": response.content, "usage": response.usage_metadata}
+
+        key = self.cassette.key("chat", model=self.model, temperature=self.temperature, prompt=prompt)
+        response = self.cassette.call(key, make_call)
+        return AIMessage(content=response["content"], usage_metadata=response["usage"])
+
+
+class CassetteEmbeddings(Embeddings):
+    def __init__(self, cassette: LLMCassette, model: str):
+        self.cassette = cassette
+        self.model = model
+        self._embeddings = None
+
+    def _provider(self):
+        if self._embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+
+            self._embeddings = OpenAIEmbeddings(model=self.model)
+        return self._embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [
+            self.cassette.call(
+                self.cassette.key("embedding", model=self.model, text=text),
+                lambda text=text: self._provider().embed_documents([text])[0],
+            )
+            for text in texts
+        ]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cassette.call(
+            self.cassette.key("embedding", model=self.model, text=text),
+            lambda: self._provider().embed_query(text),
+        )
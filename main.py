@@ -1,10 +1,20 @@
 import os
+import sys
+import json
+import time
 import argparse
 from pathlib import Path
 from dotenv import load_dotenv
 from ingestion import DatabaseIngestion
-from vector_index import ModelVectorIndex
+from vector_index import ModelVectorIndex, ColumnVectorIndex
 from semantic_relationship import SemanticRelationshipGenerator
+from subject_areas import SubjectAreaBuilder
+from retrieval import ContextRetriever
+from sql_generation import SQLGenerator, chat_model
+from sql_validator import SQLValidator
+from query_executor import QueryExecutor
+from llm_cassette import LLMCassette
+from evaluation import Evaluator, load_questions, EVAL_WORKERS, EVAL_MAX_RETRIES, SOURCE_DIALECT
 
 
 def parse_args():
@@ -30,6 +40,18 @@ def parse_args():
     )
 
     # Optional arguments
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted run, skipping tables already modeled or indexed",
+    )
+
+    parser.add_argument(
+        "--column-index",
+        action="store_true",
+        help="Also index every column, so single columns can be found in very large catalogs",
+    )
+
     parser.add_argument(
         "--test-queries",
         type=str,
@@ -40,6 +62,95 @@ def parse_args():
     return parser.parse_args()
 
 
+def parse_eval_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="main.py eval",
+        description="Evaluate retrieval, SQL generation and execution on a set of questions",
+    )
+    parser.add_argument(
+        "--questions",
+        type=str,
+        required=True,
+        help="JSONL file of questions, each with 'question' and 'gold_sql' or 'gold_result'",
+    )
+    parser.add_argument(
+        "--context",
+        type=str,
+        default="",
+        help="Business context passed to SQL generation",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=EVAL_WORKERS,
+        help="Questions evaluated concurrently",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=EVAL_MAX_RETRIES,
+        help="Regenerations per question after validation or execution feedback",
+    )
+    parser.add_argument(
+        "--llm-cassette",
+        type=str,
+        help="JSONL file of recorded LLM and embedding calls, to run offline",
+    )
+    parser.add_argument(
+        "--llm-mode",
+        choices=["record", "replay"],
+        default="replay",
+        help="Record calls into the cassette, or replay them without network access",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="fs_cache/eval/report.jsonl",
+        help="Where to write the per-question results",
+    )
+    return parser.parse_args(argv)
+
+
+def run_eval(args):
+    """Run the questions end to end and report accuracy, latency and token usage"""
+    embeddings, llm_factory = None, chat_model
+    if args.llm_cassette:
+        cassette = LLMCassette(args.llm_cassette, args.llm_mode)
+        embeddings, llm_factory = cassette.embeddings(), cassette.chat_model
+
+    executor = QueryExecutor(max_concurrent=args.workers)
+    evaluator = Evaluator(
+        ContextRetriever(embeddings=embeddings),
+        SQLGenerator(llm_factory=llm_factory),
+        # Generated SQL is MySQL, even when executed on SQLite offline
+        SQLValidator(dialect=SOURCE_DIALECT),
+        executor,
+        semantic_context=args.context,
+        max_retries=args.max_retries,
+        workers=args.workers,
+    )
+
+    questions = load_questions(args.questions)
+    print(f"Evaluating {len(questions)} questions with {args.workers} workers...")
+    started = time.perf_counter()
+    try:
+        results = evaluator.run(questions)
+    finally:
+        executor.dispose()
+    summary = Evaluator.summarize(results, time.perf_counter() - started)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        for record in results:
+            f.write(json.dumps(record, default=str) + "\n")
+    with open(output.with_suffix(".summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(Evaluator.format_report(results, summary))
+    print(f"✓ Results written to {output}")
+
+
 def parse_tables(table_args):
     """Convert table arguments from 'database:table' format to list of tuples"""
     tables = []
@@ -58,6 +169,9 @@ def main():
     # Load environment variables
     load_dotenv(override=True)
 
+    if len(sys.argv) > 1 and sys.argv[1] == "eval":
+        return run_eval(parse_eval_args(sys.argv[2:]))
+
     # Parse command line arguments
     args = parse_args()
 
@@ -68,20 +182,28 @@ def main():
     # Parse tables
     database_tables = parse_tables(args.tables)
 
+    ingestion = None
     try:
-        # Step 1: Database Ingestion
-        print("\n=== Step 1: Database Ingestion ===")
-        ingestion = DatabaseIngestion(database_tables, args.context)
-        ingestion.process()
-        print("✓ Database ingestion completed")
-
-        # Step 2: Build Vector Index
-        print("\n=== Step 2: Building Vector Index ===")
+        # Step 1 & 2: Database Ingestion streamed into the Vector Index
+        print("\n=== Step 1 & 2: Database Ingestion & Vector Index ===")
+        ingestion = DatabaseIngestion(database_tables, args.context, resume=args.resume)
         vector_index = ModelVectorIndex()
-        index = vector_index.build_index()
-        vector_index.save_index(index)
+        # Each model is embedded as soon as it is written, and checkpointed
+        # once the index holding it is saved
+        vector_index.index_stream(
+            ingestion.stream_models(),
+            resume=args.resume,
+            on_indexed=ingestion.mark_indexed,
+        )
+        print("✓ Database ingestion completed")
         print("✓ Vector index built and saved")
 
+        if args.column_index:
+            # The index type (flat, HNSW, IVF-PQ...) is chosen by the number of columns
+            print("\nBuilding column index...")
+            ColumnVectorIndex().build_index()
+            print("✓ Column index built and saved")
+
         # Test vector search if queries provided
         if args.test_queries:
             print("\nTesting vector search with sample queries:")
@@ -102,8 +224,18 @@ def main():
         relationship_generator.save_relationships(relationships)
         print(f"✓ Generated {len(relationships)} relationships")
 
+        # Step 4: Cluster tables into subject areas for coarse-to-fine retrieval
+        print("\n=== Step 4: Building Subject Areas ===")
+        subject_area_builder = SubjectAreaBuilder()
+        subject_areas = subject_area_builder.build()
+        subject_area_builder.save(subject_areas)
+        print(f"✓ Built {len(subject_areas['areas'])} subject areas")
+
     except Exception as e:
         print(f"Error during processing: {str(e)}")
+        print("Completed tables are checkpointed, rerun with --resume to continue.")
+        # Don't let later steps or callers run on partial output
+        sys.exit(1)
     finally:
         if ingestion:
             ingestion.close()
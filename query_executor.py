@@ -0,0 +1,436 @@
+import os
+import time
+from pathlib import Path
+import threading
+from collections import OrderedDict, deque
+from typing import Dict
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool
+
+load_dotenv()
+
+# Admission control for agent-issued queries, per database
+QUERY_MAX_CONCURRENT = int(os.getenv("QUERY_MAX_CONCURRENT", "4"))
+QUERY_MAX_QUEUE = int(os.getenv("QUERY_MAX_QUEUE", "16"))
+QUERY_QUEUE_TIMEOUT_S = float(os.getenv("QUERY_QUEUE_TIMEOUT_S", "30"))
+QUERY_STATEMENT_TIMEOUT_MS = int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS", "30000"))
+
+# Driver error codes raised when a statement timeout is hit
+MYSQL_STATEMENT_TIMEOUT_ERRNO = 3024
+POSTGRES_QUERY_CANCELED_PGCODE = "57014"
+
+
+def set_statement_timeout(connection, timeout_ms: int):
+    """Bound the run time of the statements executed on this connection"""
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        connection.execute(text(f"SET SESSION max_execution_time = {int(timeout_ms)}"))
+    elif dialect == "postgresql":
+        # SET LOCAL is reverted when the connection's transaction ends
+        connection.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+
+
+def connection_url_template() -> URL:
+    """Build the connection URL for DATASOURCE_TYPE without a database selected"""
+    db_type = os.getenv("DATASOURCE_TYPE", "mysql").lower()
+    if db_type == "sqlite":
+        # Offline runs such as evaluation, see database_url
+        return URL.create("sqlite")
+    drivers = {"mysql": "mysql+mysqlconnector", "postgresql": "postgresql"}
+    if db_type not in drivers:
+        raise ValueError(f"Unsupported database type: {db_type}")
+    port = os.getenv("DB_PORT")
+    return URL.create(
+        drivers[db_type],
+        username=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        host=os.getenv("DB_HOST"),
+        # Without DB_PORT the driver's default port is used
+        port=int(port) if port else None,
+        database=None,
+    )
+
+
+def database_url(url_template: URL, database_name: str) -> URL:
+    """Select a database on the template, for SQLite a file <SQLITE_PATH>/<database>.db"""
+    if url_template.get_backend_name() == "sqlite":
+        path = Path(os.getenv("SQLITE_PATH", "fs_cache/sqlite")) / f"{database_name}.db"
+        return url_template.set(database=str(path))
+    return url_template.set(database=database_name)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a query cannot be admitted because the wait queue is full or timed out"""
+
+
+class QueryCancelled(Exception):
+    """Raised when the agent run that issued a query has been abandoned"""
+
+
+class QueryRows(list):
+    """Rows of an executed query, with a notice when the cost guard rewrote it (e.g. added a LIMIT)"""
+
+    def __init__(self, rows, notice=None):
+        super().__init__(rows)
+        self.notice = notice
+
+
+class _Ticket:
+    def __init__(self, query_id=None):
+        self.query_id = query_id
+        self.granted = False
+        self.cancelled = False
+
+
+class _RunningQuery:
+    """A query holding a pooled connection, and the backend connection id to cancel it with"""
+
+    def __init__(self, database_name: str, backend_id):
+        self.database_name = database_name
+        self.backend_id = backend_id
+        # Held while the query is killed, so its connection cannot be reused meanwhile
+        self.lock = threading.Lock()
+        self.finished = False
+        self.killed = False
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue, fair across conversation threads.
+
+    Waiting queries are queued per thread ID and granted round-robin, so one
+    conversation issuing many queries cannot starve the others.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = QUERY_MAX_CONCURRENT,
+        max_queue: int = QUERY_MAX_QUEUE,
+        queue_timeout_s: float = QUERY_QUEUE_TIMEOUT_S,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self._condition = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        # thread_id -> deque of waiting tickets, in round-robin order
+        self._queues = OrderedDict()
+        self._counters = {"admitted": 0, "rejected": 0, "timed_out": 0, "cancelled": 0}
+
+    def acquire(self, thread_id: str, query_id=None):
+        with self._condition:
+            if self._active < self.max_concurrent and not self._queued:
+                self._active += 1
+                self._counters["admitted"] += 1
+                return
+
+            if self._queued >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise AdmissionRejected(
+                    f"{self._queued} queries are already waiting for this database"
+                )
+
+            ticket = _Ticket(query_id)
+            self._queues.setdefault(thread_id, deque()).append(ticket)
+            self._queued += 1
+            deadline = time.monotonic() + self.queue_timeout_s
+
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if ticket.cancelled:
+                    self._counters["cancelled"] += 1
+                    raise QueryCancelled(f"Agent run for thread {thread_id} was abandoned")
+                if remaining <= 0:
+                    self._remove(thread_id, ticket)
+                    self._counters["timed_out"] += 1
+                    raise AdmissionRejected(
+                        f"Waited more than {self.queue_timeout_s}s for a free slot"
+                    )
+                self._condition.wait(remaining)
+
+            self._counters["admitted"] += 1
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._grant_next()
+
+    def cancel(self, thread_id: str, query_id=None):
+        """Drop the waiting queries of a thread, or only the one with query_id"""
+        with self._condition:
+            for ticket in list(self._queues.get(thread_id, deque())):
+                if query_id is None or ticket.query_id == query_id:
+                    ticket.cancelled = True
+                    self._remove(thread_id, ticket)
+            self._condition.notify_all()
+
+    def _remove(self, thread_id: str, ticket: _Ticket):
+        queue = self._queues.get(thread_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[thread_id]
+
+    def _grant_next(self):
+        while self._active < self.max_concurrent and self._queues:
+            thread_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                # Move this thread behind the others that are waiting
+                self._queues.move_to_end(thread_id)
+            else:
+                del self._queues[thread_id]
+            self._queued -= 1
+            ticket.granted = True
+            self._active += 1
+        self._condition.notify_all()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "active": self._active,
+                "queue_depth": self._queued,
+                "waiting_threads": len(self._queues),
+                **self._counters,
+            }
+
+
+class QueryExecutor:
+    """Execute agent-generated queries on pooled engines behind admission control"""
+
+    def __init__(
+        self,
+        validator=None,
+        guard=None,
+        accelerator=None,
+        max_concurrent: int = QUERY_MAX_CONCURRENT,
+        max_queue: int = QUERY_MAX_QUEUE,
+        queue_timeout_s: float = QUERY_QUEUE_TIMEOUT_S,
+        statement_timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS,
+    ):
+        self.validator = validator
+        self.guard = guard
+        # Optional AccelerationTier serving eligible queries from local snapshots
+        self.accelerator = accelerator
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.statement_timeout_ms = statement_timeout_ms
+        self.connection_url_template = connection_url_template()
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._controllers = {}
+        # thread_id -> {running query key: _RunningQuery}
+        self._running = {}
+        # thread_id -> time of the last cancellation, newer runs are unaffected
+        self._cancelled_at = {}
+        # query ids cancelled individually while waiting or running
+        self._cancelled_queries = set()
+
+    def _get(self, database_name: str):
+        with self._lock:
+            if database_name not in self._engines:
+                self._engines[database_name] = create_engine(
+                    database_url(self.connection_url_template, database_name),
+                    pool_size=self.max_concurrent,
+                    max_overflow=0,
+                    pool_pre_ping=True,
+                )
+                self._controllers[database_name] = AdmissionController(
+                    self.max_concurrent, self.max_queue, self.queue_timeout_s
+                )
+            return self._engines[database_name], self._controllers[database_name]
+
+    @staticmethod
+    def _backend_id(connection):
+        dialect = connection.dialect.name
+        if dialect == "mysql":
+            return connection.execute(text("SELECT CONNECTION_ID()")).scalar()
+        if dialect == "postgresql":
+            return connection.execute(text("SELECT pg_backend_pid()")).scalar()
+        return None
+
+    @staticmethod
+    def _is_statement_timeout(error: DBAPIError) -> bool:
+        return (
+            getattr(error.orig, "errno", None) == MYSQL_STATEMENT_TIMEOUT_ERRNO
+            or getattr(error.orig, "pgcode", None) == POSTGRES_QUERY_CANCELED_PGCODE
+        )
+
+    def _is_cancelled(self, thread_id: str, query_id, started: float) -> bool:
+        with self._lock:
+            return (
+                self._cancelled_at.get(thread_id, 0) >= started
+                or query_id in self._cancelled_queries
+            )
+
+    def estimate(self, query: str, database_name: str, thread_id: str = "default"):
+        """EXPLAIN a query with the cost guard, returning None if it cannot be estimated"""
+        if not self.guard:
+            return None
+        engine, controller = self._get(database_name)
+        try:
+            controller.acquire(thread_id)
+        except AdmissionRejected:
+            return None
+        try:
+            with engine.connect() as connection:
+                return self.guard.explain(connection, query.strip().rstrip(";"))
+        except Exception:
+            return None
+        finally:
+            controller.release()
+
+    def execute(
+        self, query: str, database_name: str, thread_id: str = "default", query_id=None
+    ):
+        """Execute a query and return its rows, or feedback for the agent if it cannot run.
+
+        ``query_id`` lets a single query be cancelled without cancelling its thread.
+        """
+        if self.validator:
+            validation = self.validator.validate(query)
+            if not validation["valid"]:
+                return self.validator.format_feedback(query, validation)
+            query = validation["sql"]
+
+        if self.accelerator:
+            # Read-only queries on fresh snapshots never reach the source database
+            rows = self.accelerator.execute(query, database_name)
+            if rows is not None:
+                return rows
+
+        started = time.monotonic()
+        engine, controller = self._get(database_name)
+        try:
+            controller.acquire(thread_id, query_id)
+        except AdmissionRejected as e:
+            return f"Database {database_name} is busy, try again shortly: {str(e)}"
+        except QueryCancelled:
+            with self._lock:
+                self._cancelled_queries.discard(query_id)
+            raise
+
+        key = query_id if query_id is not None else object()
+        try:
+            with engine.connect() as connection:
+                backend_id = self._backend_id(connection)
+                if self._is_cancelled(thread_id, query_id, started):
+                    raise QueryCancelled(f"Query of thread {thread_id} was cancelled")
+                running = _RunningQuery(database_name, backend_id)
+                with self._lock:
+                    self._running.setdefault(thread_id, {})[key] = running
+
+                try:
+                    notice = None
+                    if self.guard:
+                        guard = self.guard.check(connection, query)
+                        if guard["reason"]:
+                            print(self.guard.format_feedback(guard))
+                        if not guard["allowed"]:
+                            return self.guard.format_feedback(guard)
+                        if guard["reason"]:
+                            # Allowed after a rewrite, the caller must know the result is partial
+                            notice = self.guard.format_feedback(guard)
+                        query = guard["query"]
+
+                    set_statement_timeout(connection, self.statement_timeout_ms)
+                    return QueryRows(connection.execute(text(query)).fetchall(), notice)
+                finally:
+                    # Waits for a kill in progress; once finished, cancel() leaves this
+                    # backend alone, it may run another query after returning to the pool
+                    with running.lock:
+                        running.finished = True
+                        if running.killed:
+                            # The kill may land after the statement ended, don't reuse the connection
+                            connection.invalidate()
+        except DBAPIError as e:
+            if self._is_cancelled(thread_id, query_id, started):
+                raise QueryCancelled(f"Query of thread {thread_id} was cancelled") from e
+            if self._is_statement_timeout(e):
+                return (
+                    f"Query exceeded the statement timeout of {self.statement_timeout_ms} ms. "
+                    "Narrow the query (filters on indexed columns, fewer joins) and try again."
+                )
+            raise
+        finally:
+            with self._lock:
+                running = self._running.get(thread_id, {})
+                running.pop(key, None)
+                if not running:
+                    self._running.pop(thread_id, None)
+                self._cancelled_queries.discard(query_id)
+            controller.release()
+
+    def cancel(self, thread_id: str, query_id=None):
+        """Cancel the waiting and running queries of an abandoned agent run.
+
+        With query_id, only that query is cancelled and the thread keeps running.
+        """
+        with self._lock:
+            if query_id is None:
+                now = time.monotonic()
+                self._cancelled_at[thread_id] = now
+                # Only queries started before a cancellation check it, and those finish
+                # within the queue and statement timeouts
+                horizon = now - self.queue_timeout_s - self.statement_timeout_ms / 1000 - 60
+                for cancelled_thread, cancelled_at in list(self._cancelled_at.items()):
+                    if cancelled_at < horizon:
+                        del self._cancelled_at[cancelled_thread]
+                running = list(self._running.get(thread_id, {}).values())
+            else:
+                self._cancelled_queries.add(query_id)
+                running = [
+                    value
+                    for key, value in self._running.get(thread_id, {}).items()
+                    if key == query_id
+                ]
+            controllers = list(self._controllers.values())
+
+        for controller in controllers:
+            controller.cancel(thread_id, query_id)
+
+        for query in running:
+            if query.backend_id is None:
+                continue
+            with query.lock:
+                if query.finished:
+                    # Its connection is back in the pool, the backend may run another query
+                    continue
+                query.killed = True
+                self._kill(query.database_name, query.backend_id)
+
+    def _kill(self, database_name: str, backend_id):
+        # Use a dedicated connection, the pool may be exhausted by the queries to cancel
+        engine = create_engine(
+            database_url(self.connection_url_template, database_name), poolclass=NullPool
+        )
+        try:
+            with engine.connect() as connection:
+                if connection.dialect.name == "mysql":
+                    connection.execute(text(f"KILL QUERY {int(backend_id)}"))
+                elif connection.dialect.name == "postgresql":
+                    connection.execute(
+                        text("SELECT pg_cancel_backend(:pid)"), {"pid": int(backend_id)}
+                    )
+        except Exception as e:
+            print(f"Warning: Could not cancel query on backend {backend_id}: {str(e)}")
+        finally:
+            engine.dispose()
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Queue depth, active queries and rejection counts per database"""
+        with self._lock:
+            controllers = dict(self._controllers)
+        return {name: controller.stats() for name, controller in controllers.items()}
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+            self._controllers.clear()
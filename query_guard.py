@@ -0,0 +1,225 @@
+import os
+import json
+from typing import List, Dict
+from dotenv import load_dotenv
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlalchemy import text
+
+load_dotenv()
+
+# Thresholds above which LLM-generated queries are not sent to the database
+QUERY_GUARD_MAX_ROWS_EXAMINED = int(os.getenv("QUERY_GUARD_MAX_ROWS_EXAMINED", "1000000"))
+QUERY_GUARD_MAX_FULL_SCAN_ROWS = int(os.getenv("QUERY_GUARD_MAX_FULL_SCAN_ROWS", "100000"))
+# Row limit of unfiltered single-table SELECTs that would otherwise be rejected
+QUERY_GUARD_ROW_LIMIT = int(os.getenv("QUERY_GUARD_ROW_LIMIT", "100"))
+
+
+class QueryCostGuard:
+    """Estimate the cost of a query with EXPLAIN before it is executed.
+
+    Queries whose plan examines too many rows, or fully scans a large table,
+    are rejected with a reason that can be fed back to the SQL generator.
+    The one exception is an unfiltered SELECT of a single table, where the
+    only problem is the size of the output: the database stops reading
+    after LIMIT rows. Such a query runs unchanged when it already has a
+    LIMIT of at most row_limit (EXPLAIN estimates ignore the LIMIT), and is
+    otherwise rewritten with that LIMIT. A filtered query is always
+    rejected, a selective filter on an unindexed column still scans the
+    whole table before finding its rows.
+    """
+
+    def __init__(
+        self,
+        max_rows_examined: int = QUERY_GUARD_MAX_ROWS_EXAMINED,
+        max_full_scan_rows: int = QUERY_GUARD_MAX_FULL_SCAN_ROWS,
+        row_limit: int = QUERY_GUARD_ROW_LIMIT,
+    ):
+        self.max_rows_examined = max_rows_examined
+        self.max_full_scan_rows = max_full_scan_rows
+        self.row_limit = row_limit
+
+    def explain(self, connection, query: str) -> Dict:
+        """Run EXPLAIN and return the estimated rows examined and full scans"""
+        dialect = connection.dialect.name
+        if dialect == "mysql":
+            plan = connection.execute(text(f"EXPLAIN FORMAT=JSON {query}")).scalar()
+            full_scans = []
+            rows_examined = self._walk_mysql_plan(json.loads(plan), full_scans)
+        elif dialect == "postgresql":
+            plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            full_scans = []
+            rows_examined = self._walk_postgres_plan(plan[0]["Plan"], 1, full_scans)
+        else:
+            raise ValueError(f"Unsupported database type: {dialect}")
+        return {"rows_examined": int(rows_examined), "full_scans": full_scans}
+
+    def _walk_mysql_plan(self, node, full_scans: List[Dict]) -> float:
+        """Sum rows examined over every nested loop of a MySQL JSON plan"""
+        if isinstance(node, list):
+            return sum(self._walk_mysql_plan(item, full_scans) for item in node)
+        if not isinstance(node, dict):
+            return 0
+
+        rows_examined = 0
+        if "nested_loop" in node:
+            # Each table of a nested loop is scanned once per row of the join prefix
+            prefix_rows = 1
+            for item in node["nested_loop"]:
+                table = item.get("table", {})
+                rows_examined += prefix_rows * table.get("rows_examined_per_scan", 0)
+                self._record_mysql_scan(table, full_scans)
+                prefix_rows = max(table.get("rows_produced_per_join", prefix_rows), 1)
+                rows_examined += self._walk_mysql_children(table, full_scans)
+            return rows_examined
+
+        if "table" in node and isinstance(node["table"], dict):
+            table = node["table"]
+            rows_examined += table.get("rows_examined_per_scan", 0)
+            self._record_mysql_scan(table, full_scans)
+            return rows_examined + self._walk_mysql_children(table, full_scans)
+
+        return self._walk_mysql_children(node, full_scans)
+
+    def _walk_mysql_children(self, node: Dict, full_scans: List[Dict]) -> float:
+        return sum(
+            self._walk_mysql_plan(value, full_scans)
+            for key, value in node.items()
+            if isinstance(value, (dict, list)) and key != "table"
+        )
+
+    @staticmethod
+    def _record_mysql_scan(table: Dict, full_scans: List[Dict]):
+        if table.get("access_type") in ("ALL", "index"):
+            full_scans.append(
+                {
+                    "table": table.get("table_name"),
+                    "rows": int(table.get("rows_examined_per_scan", 0)),
+                    "possible_keys": table.get("possible_keys", []),
+                }
+            )
+
+    def _walk_postgres_plan(self, node: Dict, loops: float, full_scans: List[Dict]) -> float:
+        """Sum rows read by scan nodes, multiplied by how often they are looped"""
+        rows_examined = 0
+        if "Scan" in node.get("Node Type", ""):
+            rows_examined += loops * node.get("Plan Rows", 0)
+            if node["Node Type"] == "Seq Scan":
+                full_scans.append(
+                    {
+                        "table": node.get("Relation Name"),
+                        "rows": int(node.get("Plan Rows", 0)),
+                        "possible_keys": [],
+                    }
+                )
+
+        children = node.get("Plans", [])
+        for position, child in enumerate(children):
+            child_loops = loops
+            if node.get("Node Type") == "Nested Loop" and position == 1:
+                # The inner side runs once per row of the outer side
+                child_loops = loops * max(children[0].get("Plan Rows", 1), 1)
+            rows_examined += self._walk_postgres_plan(child, child_loops, full_scans)
+        return rows_examined
+
+    def check(self, connection, query: str) -> Dict:
+        """Decide whether a query may run, possibly rewriting it with a row limit"""
+        query = query.strip().rstrip(";")
+        try:
+            estimate = self.explain(connection, query)
+        except Exception as e:
+            # Let execution surface the real error to the agent
+            print(f"Warning: Could not EXPLAIN query: {str(e)}")
+            connection.rollback()
+            return {"allowed": True, "query": query, "reason": None}
+
+        reasons = []
+        if estimate["rows_examined"] > self.max_rows_examined:
+            reasons.append(
+                f"the plan examines about {estimate['rows_examined']:,} rows "
+                f"(limit {self.max_rows_examined:,})"
+            )
+        for scan in estimate["full_scans"]:
+            if scan["rows"] > self.max_full_scan_rows:
+                reason = f"full scan of table '{scan['table']}' ({scan['rows']:,} rows)"
+                if scan["possible_keys"]:
+                    reason += f", usable indexes: {scan['possible_keys']}"
+                reasons.append(reason)
+
+        result = {"allowed": not reasons, "query": query, **estimate}
+        if not reasons:
+            result["reason"] = None
+            return result
+
+        rewritten = self.add_row_limit(connection.dialect.name, query)
+        if rewritten == query:
+            # Already limited, the estimate is for rows the query never reads
+            result.update(allowed=True, reason=None)
+            return result
+        if rewritten:
+            result.update(allowed=True, query=rewritten)
+        result["reason"] = "; ".join(reasons)
+        return result
+
+    def add_row_limit(self, dialect: str, query: str):
+        """Bound an unfiltered single-table SELECT to row_limit rows, or return None if it cannot stop early.
+
+        A query whose LIMIT is already at most row_limit is returned unchanged,
+        a larger LIMIT is lowered.
+        """
+        try:
+            statement = sqlglot.parse_one(
+                query, read="postgres" if dialect == "postgresql" else dialect
+            )
+        except SqlglotError:
+            return None
+        # An OFFSET reads and discards rows before the first one returned
+        if not isinstance(statement, exp.Select) or statement.args.get("offset"):
+            return None
+        source = statement.args.get("from")
+        # Filters and joins may read the whole table before the first row qualifies
+        if (
+            source is None
+            or not isinstance(source.this, exp.Table)
+            or statement.args.get("where")
+            or statement.args.get("joins")
+            or statement.args.get("having")
+            or statement.find(exp.Subquery)
+        ):
+            return None
+        # Blocking operators need the whole input before returning the first row
+        if (
+            statement.args.get("group")
+            or statement.args.get("order")
+            or statement.args.get("distinct")
+            or statement.find(exp.AggFunc, exp.Window)
+        ):
+            return None
+        limit = statement.args.get("limit")
+        if limit is not None:
+            try:
+                if int(limit.expression.name) <= self.row_limit:
+                    return query
+            except (AttributeError, ValueError):
+                # e.g. a parameter or an expression
+                return None
+        return statement.limit(self.row_limit).sql(
+            dialect="postgres" if dialect == "postgresql" else dialect
+        )
+
+    @staticmethod
+    def format_feedback(result: Dict) -> str:
+        """Render the guard decision as feedback for the agent"""
+        if result["allowed"]:
+            return (
+                f"Query rewritten by the cost guard ({result['reason']}), "
+                f"executed as: {result['query']}. Only the first rows are returned, "
+                "add a filter or an aggregation to get a complete answer."
+            )
+        return (
+            f"Query rejected by the cost guard: {result['reason']}. "
+            "Filter or join on indexed columns, or narrow the query, and try again."
+        )
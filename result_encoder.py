@@ -0,0 +1,165 @@
+import os
+import csv
+import uuid
+import datetime
+from decimal import Decimal
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional, Sequence
+from dotenv import load_dotenv
+import pandas as pd
+
+load_dotenv()
+
+# Tokens a query result may take in the agent context before it is summarised
+RESULT_TOKEN_BUDGET = int(os.getenv("RESULT_TOKEN_BUDGET", "2000"))
+# Where full results are written when only a summary goes to the agent
+RESULT_SPILL_PATH = os.getenv("RESULT_SPILL_PATH", "fs_cache/results")
+
+TOP_VALUES = 3
+MAX_VALUE_LENGTH = 80
+
+
+def _count_tokens_approx(value: str) -> int:
+    return len(value) // 4 + 1
+
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(value: str) -> int:
+        return len(_encoding.encode(value))
+
+except Exception:
+    # Fall back to ~4 characters per token when tiktoken or its files are unavailable
+    count_tokens = _count_tokens_approx
+
+
+def format_value(value) -> str:
+    """Render a single value tersely, without Python reprs like Decimal('1.00')"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, Decimal):
+        return format(value, "f")
+    if isinstance(value, float):
+        # 15 significant digits round-trip what a double holds, e.g. amounts and ids
+        return format(value, ".15g")
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time(0) and value.tzinfo is None:
+            return value.date().isoformat()
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "0x" + bytes(value)[:16].hex()
+    value = str(value).replace("\\", "\\\\").replace("|", "\\|").replace("\n", "\\n")
+    if len(value) > MAX_VALUE_LENGTH:
+        value = value[: MAX_VALUE_LENGTH - 3] + "..."
+    return value
+
+
+class ResultEncoder:
+    """Serialise query results compactly for the agent context.
+
+    Results are rendered as a header line followed by pipe-separated rows.
+    When that exceeds the token budget, the agent gets a per-column summary
+    and a preview instead, and the full result is written to a CSV file.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = RESULT_TOKEN_BUDGET,
+        spill_path: str = RESULT_SPILL_PATH,
+    ):
+        self.token_budget = token_budget
+        self.spill_path = Path(spill_path)
+
+    def encode(self, rows: Sequence, columns: Optional[List[str]] = None) -> str:
+        # e.g. the cost guard's note that the query was rewritten with a LIMIT
+        notice = getattr(rows, "notice", None)
+        encoded = self._encode(rows, columns)
+        return f"{notice}\n{encoded}" if notice else encoded
+
+    def _encode(self, rows: Sequence, columns: Optional[List[str]] = None) -> str:
+        if columns is None:
+            # SQLAlchemy Row objects carry their column names
+            columns = list(rows[0]._fields) if rows and hasattr(rows[0], "_fields") else []
+        if not rows:
+            return "0 rows"
+
+        header = "|".join(columns)
+        lines = ["|".join(format_value(value) for value in row) for row in rows]
+        table = f"{len(rows)} rows\n{header}\n" + "\n".join(lines)
+        if count_tokens(table) <= self.token_budget:
+            return table
+        return self.summarize(rows, columns, header, lines)
+
+    def summarize(self, rows: Sequence, columns: List[str], header: str, lines: List[str]) -> str:
+        spill_file = self.spill(rows, columns)
+        # Columns are labelled by position, names repeat in e.g. SELECT * over a join
+        frame = pd.DataFrame.from_records(
+            [tuple(row) for row in rows], columns=range(len(columns))
+        )
+
+        # Decimals arrive as objects; convert them so they are aggregated as numbers
+        for name in frame.columns[frame.dtypes == object]:
+            sample = frame[name].dropna()
+            if len(sample) and all(isinstance(value, Decimal) for value in sample.head(100)):
+                frame[name] = pd.to_numeric(frame[name], errors="coerce")
+
+        numeric = frame.select_dtypes("number")
+        means = numeric.mean() if len(numeric.columns) else None
+        null_counts = frame.isna().sum()
+
+        summary = [
+            f"{len(rows)} rows, too large for the context (budget {self.token_budget} tokens).",
+            f"Full result saved to {spill_file}. Summary per column:",
+        ]
+        for position, name in enumerate(columns):
+            parts = []
+            # min/max of the values as returned, pandas would turn ids into floats (1e+07)
+            # and booleans into True/False
+            values = [row[position] for row in rows if row[position] is not None]
+            try:
+                if values:
+                    parts.append(f"min={format_value(min(values))} max={format_value(max(values))}")
+            except TypeError:
+                pass
+            if means is not None and position in means.index:
+                parts.append(f"mean={float(means[position]):.10g}")
+            else:
+                # Counted as rendered in the rows, which also makes every value hashable
+                counts = Counter(format_value(value) for value in values)
+                parts.append(
+                    f"distinct={len(counts)} top="
+                    + ", ".join(f"{value} ({count})" for value, count in counts.most_common(TOP_VALUES))
+                )
+            if null_counts[position]:
+                parts.append(f"nulls={int(null_counts[position])}")
+            summary.append(f"- {name}: {' '.join(parts)}")
+
+        # Fill the remaining budget with the first rows
+        text = "\n".join(summary) + f"\nFirst rows:\n{header}"
+        used = count_tokens(text)
+        shown = 0
+        for line in lines:
+            used += count_tokens(line) + 1
+            if used > self.token_budget:
+                break
+            text += "\n" + line
+            shown += 1
+        return text + f"\n({shown} of {len(rows)} rows shown)"
+
+    def spill(self, rows: Sequence, columns: List[str]) -> Path:
+        """Write the full result to a CSV file and return its path"""
+        self.spill_path.mkdir(parents=True, exist_ok=True)
+        spill_file = self.spill_path / f"result_{uuid.uuid4().hex}.csv"
+        with open(spill_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(tuple(row) for row in rows)
+        return spill_file
@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+from collections import defaultdict
+from typing import List, Dict
+from vector_index import ModelVectorIndex, ColumnVectorIndex
+from subject_areas import SubjectAreaIndex, RETRIEVAL_MAX_TABLES, table_id
+from ddl_generator import load_relationships, generate_ddl_for_models_and_relationships
+
+# Flat search settings, used when no subject areas have been built
+FLAT_SEARCH_K = 5
+FLAT_SIMILARITY_THRESHOLD = 1.6
+
+
+class ContextRetriever:
+    """Retrieve the models and relationships relevant to the reasoning steps.
+
+    With subject areas built (see subject_areas.py), retrieval is coarse to
+    fine: the query is matched against area centroids first and only the
+    tables of the best areas are ranked. Otherwise it falls back to a flat
+    similarity search over the whole vector index. When a column index has
+    been built, the parent tables of matching columns are added as well.
+    """
+
+    def __init__(
+        self,
+        index_path: str = "fs_cache/vector_index",
+        relationships_path: str = "fs_cache/relationships",
+        subject_areas_path: str = "fs_cache/subject_areas",
+        models_path: str = "fs_cache/models",
+        column_index_path: str = "fs_cache/column_index",
+        embeddings=None,
+    ):
+        self.vector_index = ModelVectorIndex(models_path, embeddings=embeddings)
+        self.index = self.vector_index.load_index(index_path)
+        self.relationships = load_relationships(relationships_path)
+        self.relationships_by_model = defaultdict(list)
+        for rel in self.relationships:
+            for model_name in rel.get("models", []):
+                self.relationships_by_model[model_name].append(rel)
+
+        self.models = {
+            table_id(model): model for model in self.vector_index.load_model_files()
+        }
+        self.subject_areas = None
+        if SubjectAreaIndex.exists(subject_areas_path):
+            self.subject_areas = SubjectAreaIndex(subject_areas_path)
+        self.column_index = None
+        if (Path(column_index_path) / "index.faiss").exists():
+            self.column_index = ColumnVectorIndex(
+                models_path, embeddings=self.vector_index.embeddings
+            ).load_index(column_index_path)
+
+    def search(self, reasoning_steps: str) -> List[Dict]:
+        """Return the relevant models, most relevant first"""
+        # Embedded once for the table, area and column searches
+        query_vector = self.vector_index.embeddings.embed_query(reasoning_steps)
+        if self.subject_areas is None:
+            docs_and_scores = self.index.similarity_search_with_score_by_vector(
+                query_vector, k=FLAT_SEARCH_K
+            )
+            models = [
+                json.loads(doc.page_content)
+                for doc, score in docs_and_scores
+                if score <= FLAT_SIMILARITY_THRESHOLD
+            ]
+        else:
+            models = [
+                self.models[result["table"]]
+                for result in self.subject_areas.search(query_vector)
+                if result["table"] in self.models
+            ]
+
+        if self.column_index is not None:
+            # Tables owning a matching column, e.g. a "discount rate" column of an
+            # otherwise unrelated-looking table
+            found = {table_id(model) for model in models}
+            for table in ColumnVectorIndex.search_tables(self.column_index, query_vector):
+                key = f"{table['database']}.{table['table_name']}"
+                if len(models) >= RETRIEVAL_MAX_TABLES:
+                    break
+                if key not in found and key in self.models:
+                    found.add(key)
+                    models.append(self.models[key])
+        return models
+
+    def get_db_context(self, reasoning_steps: str) -> List[Dict]:
+        """Group each relevant model with the relationships it takes part in"""
+        return [
+            {"model": model, "relationships": self.relationships_by_model.get(model["name"], [])}
+            for model in self.search(reasoning_steps)
+        ]
+
+    def get_ddl(self, context: List[Dict]) -> str:
+        """DDL for the retrieved context, reusing an area's bundle when it covers exactly that area"""
+        if self.subject_areas is not None:
+            bundle = self.subject_areas.bundle_for(
+                [table_id(entry["model"]) for entry in context]
+            )
+            if bundle is not None:
+                return bundle
+        return generate_ddl_for_models_and_relationships(context)
@@ -0,0 +1,395 @@
+import os
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from dotenv import load_dotenv
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from fastapi import FastAPI
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from retrieval import ContextRetriever
+from sql_generation import SQLGenerator, chat_model
+from sql_validator import SQLValidator, strip_markdown
+from query_guard import QueryCostGuard
+from query_executor import QueryExecutor
+from acceleration import AccelerationTier, ACCELERATION_TABLES, ACCELERATION_HOT_TABLES
+
+load_dotenv()
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+# Business context used when a request does not bring its own
+SERVICE_SEMANTIC_CONTEXT = os.getenv("SERVICE_SEMANTIC_CONTEXT", "")
+# Regenerations per question after validation or execution feedback
+SERVICE_MAX_RETRIES = int(os.getenv("SERVICE_MAX_RETRIES", "2"))
+# Rows returned per query, the rest is reported as truncated
+SERVICE_MAX_ROWS = int(os.getenv("SERVICE_MAX_ROWS", "1000"))
+# How often the catalog files are checked for changes, 0 reloads only on request
+SERVICE_RELOAD_INTERVAL_S = float(os.getenv("SERVICE_RELOAD_INTERVAL_S", "0"))
+
+CATALOG_PATHS = (
+    "fs_cache/models",
+    "fs_cache/relationships",
+    "fs_cache/vector_index",
+    "fs_cache/subject_areas",
+    "fs_cache/column_index",
+)
+FLIGHT_KINDS = ("retrieval", "generation", "execution")
+
+
+def catalog_mtime(paths=CATALOG_PATHS) -> float:
+    """Latest modification time of the catalog files, to detect a new ingestion"""
+    return max(
+        (file.stat().st_mtime for path in paths for file in Path(path).glob("*") if file.is_file()),
+        default=0.0,
+    )
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls.
+
+    The first caller of a key runs the call in the thread pool; callers
+    arriving while it runs await the same result (or exception) instead of
+    starting their own. Nothing is cached once the call completes. Waiters
+    hold no thread, and a waiter going away does not cancel the call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._counters = Counter()
+
+    async def do(self, kind: str, key, fn, *args):
+        call_key = (kind, key)
+        task = self._calls.get(call_key)
+        if task is None:
+            self._counters[(kind, "calls")] += 1
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            self._calls[call_key] = task
+
+            def done(finished):
+                self._calls.pop(call_key, None)
+                if not finished.cancelled():
+                    # Retrieved here in case every waiter went away
+                    finished.exception()
+
+            task.add_done_callback(done)
+        else:
+            self._counters[(kind, "coalesced")] += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            kind: {
+                "calls": self._counters[(kind, "calls")],
+                "coalesced": self._counters[(kind, "coalesced")],
+                "in_flight": sum(1 for call_kind, _ in self._calls if call_kind == kind),
+            }
+            for kind in FLIGHT_KINDS
+        }
+
+
+class Catalog:
+    """The retriever and validator built from one version of the catalog files"""
+
+    def __init__(self, generation: int, retriever: ContextRetriever, validator: SQLValidator, mtime: float):
+        self.generation = generation
+        self.retriever = retriever
+        self.validator = validator
+        self.mtime = mtime
+        self.loaded_at = time.time()
+
+
+class AskRequest(BaseModel):
+    question: str
+    context: Optional[str] = None
+    database: Optional[str] = None
+    thread_id: str = "service"
+    execute: bool = True
+
+
+class ContextRequest(BaseModel):
+    question: str
+
+
+class ExecuteRequest(BaseModel):
+    query: str
+    database: str
+    thread_id: str = "service"
+
+
+class QueryService:
+    """Answer questions, retrieve context and execute SQL on warm components.
+
+    The retriever (vector indexes, relationship graph, subject areas), the
+    validator and the executor's connection pools are built once and shared
+    by all requests. Identical concurrent retrievals, generations and
+    read-only query executions are coalesced with SingleFlight. A catalog
+    reload builds a new retriever and validator in the background and swaps
+    them in; requests already running finish on the catalog they started with,
+    including its validator, which is why the shared executor has none.
+    """
+
+    def __init__(
+        self,
+        semantic_context: str = SERVICE_SEMANTIC_CONTEXT,
+        max_retries: int = SERVICE_MAX_RETRIES,
+        max_rows: int = SERVICE_MAX_ROWS,
+        embeddings=None,
+        llm_factory=chat_model,
+        guard: bool = True,
+    ):
+        self.semantic_context = semantic_context
+        self.max_retries = max_retries
+        self.max_rows = max_rows
+        self.embeddings = embeddings
+        self.generator = SQLGenerator(llm_factory=llm_factory)
+        self.catalog = self._load_catalog(1)
+        self.accelerator = None
+        if ACCELERATION_TABLES or ACCELERATION_HOT_TABLES:
+            self.accelerator = AccelerationTier()
+            self.accelerator.start()
+        self.executor = QueryExecutor(
+            guard=QueryCostGuard() if guard else None,
+            accelerator=self.accelerator,
+        )
+        self.flights = SingleFlight()
+        self._reload_lock = asyncio.Lock()
+
+    def _load_catalog(self, generation: int) -> Catalog:
+        mtime = catalog_mtime()
+        return Catalog(
+            generation,
+            ContextRetriever(embeddings=self.embeddings),
+            SQLValidator(),
+            mtime,
+        )
+
+    async def reload(self, if_changed: bool = False) -> bool:
+        """Load the catalog files again and swap them in without blocking requests"""
+        async with self._reload_lock:
+            if if_changed and catalog_mtime() <= self.catalog.mtime:
+                return False
+            catalog = await run_in_threadpool(self._load_catalog, self.catalog.generation + 1)
+            self.catalog = catalog
+            print(f"Catalog reloaded (generation {catalog.generation})")
+            return True
+
+    async def watch(self, interval_s: float):
+        """Reload the catalog whenever its files change, e.g. after an ingestion run"""
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await self.reload(if_changed=True)
+            except Exception as e:
+                print(f"Warning: Could not reload the catalog: {str(e)}")
+
+    def _normalize_query(self, query: str, validator: SQLValidator) -> Optional[str]:
+        """Canonical text of a read-only query, or None when it must not be coalesced"""
+        try:
+            statement = sqlglot.parse_one(query, read=validator.dialect)
+        except SqlglotError:
+            return None
+        if not isinstance(statement, exp.Query):
+            return None
+        return statement.sql(dialect=validator.dialect)
+
+    async def retrieve(self, question: str, catalog: Catalog):
+        def run():
+            context = catalog.retriever.get_db_context(question)
+            return context, catalog.retriever.get_ddl(context)
+
+        return await self.flights.do("retrieval", (catalog.generation, question), run)
+
+    async def generate(self, ddl: str, question: str, semantic_context: str, feedback: Optional[str]) -> str:
+        # The question stands in for the agent's reasoning steps, as in main.py eval
+        return await self.flights.do(
+            "generation",
+            (ddl, question, semantic_context, feedback),
+            self.generator.generate,
+            ddl,
+            question,
+            semantic_context,
+            question,
+            feedback,
+        )
+
+    async def execute(self, query: str, database_name: str, thread_id: str, catalog: Catalog) -> Dict:
+        """Rows of a query as JSON, or the feedback why it could not run"""
+        query = strip_markdown(query)
+
+        def run():
+            validation = catalog.validator.validate(query)
+            if not validation["valid"]:
+                return {"error": catalog.validator.format_feedback(query, validation)}
+            try:
+                result = self.executor.execute(query, database_name, thread_id)
+            except Exception as e:
+                return {"error": f"Query failed: {str(e)}"}
+            if isinstance(result, str):
+                return {"error": result}
+            columns = list(result[0]._fields) if result else []
+            return {
+                "columns": columns,
+                "rows": [list(row) for row in result[: self.max_rows]],
+                "row_count": len(result),
+                "truncated": len(result) > self.max_rows,
+                "notice": getattr(result, "notice", None),
+            }
+
+        normalized = self._normalize_query(query, catalog.validator)
+        if normalized is None:
+            # Writes and unparsable statements always run on their own
+            return await run_in_threadpool(run)
+        # Admission control and cancellation are per thread, so are shared executions
+        return await self.flights.do(
+            "execution", (catalog.generation, database_name, thread_id, normalized), run
+        )
+
+    async def context(self, question: str) -> Dict:
+        catalog = self.catalog
+        context, ddl = await self.retrieve(question, catalog)
+        return {
+            "tables": [
+                {"database": entry["model"]["database"], "table": entry["model"]["name"]}
+                for entry in context
+            ],
+            "ddl": ddl,
+            "catalog_generation": catalog.generation,
+        }
+
+    async def ask(self, request: AskRequest) -> Dict:
+        """Retrieve, generate, validate and execute, regenerating with feedback like the agent's tools"""
+        catalog = self.catalog
+        semantic_context = request.context if request.context is not None else self.semantic_context
+        started = time.perf_counter()
+        context, ddl = await self.retrieve(request.question, catalog)
+        database_name = request.database or (context[0]["model"]["database"] if context else None)
+        response = {"question": request.question, "database": database_name, "sql": None, "retries": 0}
+
+        feedback = None
+        for attempt in range(self.max_retries + 1):
+            response["retries"] = attempt
+            query = await self.generate(ddl, request.question, semantic_context, feedback)
+            response["sql"] = query
+            if query == "No information found" or database_name is None:
+                feedback = "No information found"
+                break
+            validation = catalog.validator.validate(query)
+            if not validation["valid"]:
+                feedback = catalog.validator.format_feedback(query, validation)
+                continue
+            query = response["sql"] = validation["sql"]
+            if not request.execute:
+                feedback = None
+                break
+            result = await self.execute(query, database_name, request.thread_id, catalog)
+            # Coalesced callers share the result dict, it must not be modified
+            feedback = result.get("error")
+            if feedback is None:
+                response.update(result)
+                break
+
+        response["error"] = feedback
+        response["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return response
+
+    def metrics(self) -> Dict:
+        return {
+            "catalog": {
+                "generation": self.catalog.generation,
+                "loaded_at": self.catalog.loaded_at,
+            },
+            "executor": self.executor.metrics(),
+            "single_flight": self.flights.stats(),
+            "acceleration": self.accelerator.stats() if self.accelerator else None,
+        }
+
+    def close(self):
+        if self.accelerator:
+            self.accelerator.close()
+        self.executor.dispose()
+
+
+def create_app(service_factory=QueryService, reload_interval_s: float = SERVICE_RELOAD_INTERVAL_S) -> FastAPI:
+    """ASGI app, the service is created at startup so imports and index loads are paid once"""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        service = await run_in_threadpool(service_factory)
+        app.state.service = service
+        watcher = None
+        if reload_interval_s > 0:
+            watcher = asyncio.create_task(service.watch(reload_interval_s))
+        try:
+            yield
+        finally:
+            if watcher:
+                watcher.cancel()
+            service.close()
+
+    app = FastAPI(title="Agentic NLP to SQL", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "catalog_generation": app.state.service.catalog.generation}
+
+    @app.post("/ask")
+    async def ask(request: AskRequest):
+        return await app.state.service.ask(request)
+
+    @app.post("/context")
+    async def context(request: ContextRequest):
+        return await app.state.service.context(request.question)
+
+    @app.post("/sql/execute")
+    async def execute(request: ExecuteRequest):
+        service = app.state.service
+        return await service.execute(request.query, request.database, request.thread_id, service.catalog)
+
+    @app.post("/catalog/reload")
+    async def reload():
+        service = app.state.service
+        # Requests keep being served on the current catalog while the new one loads
+        await service.reload()
+        return {"catalog_generation": service.catalog.generation}
+
+    @app.get("/metrics")
+    async def metrics():
+        return app.state.service.metrics()
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve questions, context retrieval and SQL execution over HTTP")
+    parser.add_argument("--host", type=str, default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--context", type=str, default=SERVICE_SEMANTIC_CONTEXT, help="Business context for SQL generation")
+    parser.add_argument(
+        "--reload-interval",
+        type=float,
+        default=SERVICE_RELOAD_INTERVAL_S,
+        help="Seconds between checks for a changed catalog, 0 reloads only on POST /catalog/reload",
+    )
+    args = parser.parse_args()
+
+    service_app = create_app(
+        lambda: QueryService(semantic_context=args.context), reload_interval_s=args.reload_interval
+    )
+    # A single process, so the warm components and in-flight calls are shared by every request
+    uvicorn.run(service_app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Callable, Optional
+from dotenv import load_dotenv
+import sqlglot
+from sqlglot.errors import SqlglotError
+
+load_dotenv()
+
+# Number of SQL candidates generated per question, 1 disables speculative mode
+SQL_CANDIDATES = int(os.getenv("SQL_CANDIDATES", "1"))
+# Candidates executed against the database at the same time
+SQL_CANDIDATE_MAX_PARALLEL = int(os.getenv("SQL_CANDIDATE_MAX_PARALLEL", "2"))
+
+# (temperature, prompt hint) per candidate, cycled when more candidates are requested
+CANDIDATE_VARIANTS = [
+    (0.0, None),
+    (0.4, "Prefer explicit JOINs along the relationships given in the DDLs."),
+    (0.7, "Prefer the simplest query: as few tables and joins as possible."),
+    (0.9, "Consider alternative tables or columns that could answer the question."),
+]
+
+
+class SpeculativeSQLGenerator:
+    """Generate several SQL candidates in parallel and keep the first that works.
+
+    Candidates are generated with different temperatures and prompt hints,
+    validated locally, ranked by their EXPLAIN estimate and executed with
+    bounded parallelism. The first candidate returning rows wins and the
+    remaining executions are cancelled.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[..., str],
+        validator,
+        executor,
+        candidates: int = SQL_CANDIDATES,
+        max_parallel: int = SQL_CANDIDATE_MAX_PARALLEL,
+        encoder=None,
+    ):
+        # generate(ddl, question, semantic_context, reasoning_steps, feedback, temperature=, hint=)
+        self.generate = generate
+        self.validator = validator
+        self.executor = executor
+        self.candidates = candidates
+        self.max_parallel = max_parallel
+        # Optional ResultEncoder used to render the winning rows for the agent
+        self.encoder = encoder
+
+    def generate_candidates(
+        self, ddl, question, semantic_context, reasoning_steps, feedback=None
+    ) -> List[str]:
+        """Generate the candidates in parallel, dropping duplicates"""
+        variants = [
+            CANDIDATE_VARIANTS[position % len(CANDIDATE_VARIANTS)]
+            for position in range(self.candidates)
+        ]
+        with ThreadPoolExecutor(max_workers=self.candidates) as pool:
+            futures = [
+                pool.submit(
+                    self.generate,
+                    ddl,
+                    question,
+                    semantic_context,
+                    reasoning_steps,
+                    feedback,
+                    temperature=temperature,
+                    hint=hint,
+                )
+                for temperature, hint in variants
+            ]
+            queries = []
+            for future in futures:
+                try:
+                    queries.append(future.result())
+                except Exception as e:
+                    print(f"Warning: Could not generate SQL candidate: {str(e)}")
+
+        unique, seen = [], set()
+        for query in queries:
+            key = self._normalize(query)
+            if key not in seen:
+                seen.add(key)
+                unique.append(query)
+        return unique
+
+    def _normalize(self, query: str) -> str:
+        try:
+            return sqlglot.transpile(query, read=self.validator.dialect)[0].lower()
+        except (SqlglotError, IndexError):
+            return " ".join(query.split()).lower()
+
+    def rank(self, queries: List[str], database_name: str, thread_id: str):
+        """Split candidates into valid ones ordered by estimated cost and rejected ones"""
+        valid, rejected = [], []
+        for query in queries:
+            if query == "No information found":
+                continue
+            validation = self.validator.validate(query)
+            if validation["valid"]:
+                valid.append(validation["sql"])
+            else:
+                rejected.append(
+                    {"query": query, "feedback": self.validator.format_feedback(query, validation)}
+                )
+
+        with ThreadPoolExecutor(max_workers=max(len(valid), 1)) as pool:
+            estimates = list(
+                pool.map(
+                    lambda query: self.executor.estimate(query, database_name, thread_id),
+                    valid,
+                )
+            )
+        ranked = sorted(
+            zip(valid, estimates),
+            # Candidates without an estimate go last, in generation order
+            key=lambda item: item[1]["rows_examined"] if item[1] else float("inf"),
+        )
+        return [query for query, _ in ranked], rejected
+
+    def _execute(self, query: str, database_name: str, thread_id: str, query_id: str) -> Dict:
+        try:
+            result = self.executor.execute(query, database_name, thread_id, query_id=query_id)
+        except Exception as e:
+            return {"query": query, "error": str(e)}
+        if isinstance(result, str):
+            # Feedback from the executor: guard rejection, timeout or busy database
+            return {"query": query, "error": result}
+        return {"query": query, "result": result}
+
+    def run(
+        self,
+        ddl,
+        question,
+        semantic_context,
+        reasoning_steps,
+        database_name: str,
+        thread_id: str = "default",
+        feedback=None,
+    ) -> Dict:
+        """Return the winning candidate with its rows, or the feedback of every attempt"""
+        queries = self.generate_candidates(
+            ddl, question, semantic_context, reasoning_steps, feedback
+        )
+        ranked, attempts = self.rank(queries, database_name, thread_id)
+        if not ranked:
+            return {"query": None, "attempts": attempts}
+
+        winner: Optional[Dict] = None
+        empty: Optional[Dict] = None
+        pool = ThreadPoolExecutor(max_workers=self.max_parallel)
+        futures = {}
+        try:
+            for query in ranked:
+                query_id = uuid.uuid4().hex
+                futures[pool.submit(self._execute, query, database_name, thread_id, query_id)] = query_id
+
+            for future in as_completed(futures):
+                outcome = future.result()
+                if "result" in outcome and outcome["result"]:
+                    winner = outcome
+                    break
+                if "result" in outcome:
+                    empty = empty or outcome
+                else:
+                    attempts.append({"query": outcome["query"], "feedback": outcome["error"]})
+        finally:
+            # Cancel the slower candidates: queued ones never start, running ones are killed
+            for future, query_id in futures.items():
+                if not future.cancel() and not future.done():
+                    self.executor.cancel(thread_id, query_id=query_id)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        chosen = winner or empty
+        if chosen:
+            return {"query": chosen["query"], "result": chosen["result"], "attempts": attempts}
+        return {"query": None, "attempts": attempts}
+
+    def format_result(self, outcome: Dict, database_name: str) -> str:
+        """Render the outcome for the agent"""
+        if outcome["query"] is None:
+            lines = ["None of the SQL candidates succeeded:"]
+            for attempt in outcome["attempts"]:
+                lines.append(f"- {attempt['query']}\n  {attempt['feedback']}")
+            return "\n".join(lines)
+        result = self.encoder.encode(outcome["result"]) if self.encoder else outcome["result"]
+        return (
+            f"SQL query (already executed in database {database_name}):\n"
+            f"{outcome['query']}\n\nResult:\n{result}"
+        )
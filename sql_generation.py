@@ -0,0 +1,111 @@
+import os
+from typing import Callable, Dict, Optional
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+load_dotenv()
+
+SQL_GENERATION_MODEL = os.getenv("SQL_GENERATION_MODEL", "gpt-4o-mini")
+
+
+def chat_model(model: str, temperature: float):
+    return ChatOpenAI(model=model, temperature=temperature)
+
+
+class SQLGenerator:
+    """Generate a SQL query from the retrieved DDLs, the question and the semantic context"""
+
+    def __init__(
+        self,
+        model: str = SQL_GENERATION_MODEL,
+        llm_factory: Callable[[str, float], object] = chat_model,
+    ):
+        self.model = model
+        # llm_factory(model, temperature) -> chat model, e.g. a record/replay cassette
+        self.llm_factory = llm_factory
+
+    def build_prompt(
+        self,
+        ddl: str,
+        question: str,
+        semantic_context: str,
+        resoning_steps: str,
+        feedback: str = None,
+        hint: str = None,
+    ) -> str:
+        prompt = f"""
+        Generate a SQL query based on the following DDLs, question, and semantic context:
+
+        DDLs:
+        ----*****DDLs*****----
+        {ddl}
+        ----*****END OF DDLs*****----
+
+        Question:
+        ----*****Question*****----
+        {question}
+        ----*****END OF Question*****----
+
+            Resoning Steps to approach the question:
+        ----*****Resoning Steps*****----
+        {resoning_steps}
+        ----*****END OF Resoning Steps*****----
+
+        Semantic Context:
+        ----*****Semantic Context*****----
+        {semantic_context}
+        ----*****END OF Semantic Context*****----
+
+        Note: please include the database name in the query. and only use the table names and column names that are present in the DDLs and relationship. please don't halucinate or add any new table names or column names. if you don't have enough information to generate the query, please return "No information found"
+
+        Expectation:
+            - Please only returns the SQL query, nothing else.
+            - you may generate one or more queries to answer the question.
+            - please try to use joins whenever possble
+            - always write the query in mysql syntax.
+            - prefer filtering and joining on indexed columns (PRIMARY KEY and INDEX in the DDLs) to avoid full table scans.
+        """
+
+        if feedback:
+            prompt += f"\n\nFeedback previous attempt: {feedback}"
+
+        if hint:
+            prompt += f"\n\nHint: {hint}"
+
+        return prompt
+
+    def generate(
+        self,
+        ddl: str,
+        question: str,
+        semantic_context: str,
+        resoning_steps: str,
+        feedback: str = None,
+        temperature: float = 0.0,
+        hint: str = None,
+        usage: Optional[Dict] = None,
+    ) -> str:
+        """
+        This function generates a SQL query based on the provided DDL, question, and semantic context.
+
+        Args:
+            ddl: The DDL of the models
+            question: The user's question
+            semantic_context: The business context and semantic information about the domain
+            resoning_steps: The reasoning steps for the query
+            feedback: provide the error message or any feedback to improve the query, if this tool is called again.
+            temperature: sampling temperature, raised to get diverse candidates in speculative mode
+            hint: an optional hint on how to approach the query, used to diversify candidates
+            usage: optional dict the token counts of the call are added to
+
+        Returns:
+            sql_query: The generated SQL query
+        """
+        prompt = self.build_prompt(ddl, question, semantic_context, resoning_steps, feedback, hint)
+        response = self.llm_factory(self.model, temperature).invoke(prompt)
+
+        if usage is not None and response.usage_metadata:
+            for key in ("input_tokens", "output_tokens"):
+                usage[key] = usage.get(key, 0) + response.usage_metadata.get(key, 0)
+
+        return response.content.strip()
@@ -0,0 +1,414 @@
+import os
+import re
+import json
+import difflib
+from pathlib import Path
+from typing import List, Dict, Optional
+from dotenv import load_dotenv
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+load_dotenv()
+
+# Maps DATASOURCE_TYPE values to sqlglot dialect names
+SQLGLOT_DIALECTS = {
+    "mysql": "mysql",
+    "postgresql": "postgres",
+    "sqlite": "sqlite",
+}
+
+# Statement types the validator knows how to resolve against the catalog
+SUPPORTED_STATEMENTS = (exp.Query, exp.Show, exp.Describe)
+# The agent only answers questions, statements that modify data are rejected
+# rather than resolved
+READ_ONLY_VIOLATIONS = (exp.DML, exp.Create, exp.Drop, exp.Alter, exp.TruncateTable)
+
+# sqlglot underlines the error position with ANSI escapes, noise for the LLM
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+def strip_markdown(sql: str) -> str:
+    """Remove markdown code fences the LLM sometimes wraps queries in"""
+    match = re.search(r"```(?:sql)?\s*(.*?)```", sql, re.DOTALL | re.IGNORECASE)
+    return match.group(1).strip() if match else sql.strip()
+
+
+def parse_error_message(error: SqlglotError) -> str:
+    """Describe a sqlglot error in plain text, with the position of each problem"""
+    errors = getattr(error, "errors", None)
+    if not errors:
+        return ANSI_ESCAPE.sub("", str(error))
+    messages = []
+    for detail in errors:
+        message = detail["description"]
+        if detail.get("highlight"):
+            message += f" near '{detail['highlight']}'"
+        if detail.get("line"):
+            message += f" (line {detail['line']}, column {detail['col']})"
+        messages.append(message)
+    return "; ".join(messages)
+
+
+class SQLValidator:
+    """Validate generated SQL against the ingested models and relationships.
+
+    Every table and column referenced by the query is resolved against the
+    model files in ``fs_cache/models`` so that hallucinated identifiers are
+    caught locally, before the query is sent to the database.
+    """
+
+    def __init__(
+        self,
+        models_path: str = "fs_cache/models",
+        relationships_path: str = "fs_cache/relationships",
+        dialect: Optional[str] = None,
+    ):
+        self.models_path = Path(models_path)
+        self.relationships_path = Path(relationships_path)
+        db_type = os.getenv("DATASOURCE_TYPE", "mysql").lower()
+        self.dialect = dialect or SQLGLOT_DIALECTS.get(db_type, db_type)
+        self.reload()
+
+    def reload(self):
+        """(Re)load the catalog of models and relationships from disk"""
+        # (database, table) -> {lower column name: column name}
+        self.tables = {}
+        # table -> [database, ...] for resolving unqualified table names
+        self.table_databases = {}
+        for file_path in self.models_path.glob("*.json"):
+            with open(file_path, "r") as f:
+                model = json.load(f)
+            key = (model["database"].lower(), model["name"].lower())
+            self.tables[key] = {
+                col["name"].lower(): col["name"] for col in model["columns"]
+            }
+            self.table_databases.setdefault(key[1], []).append(key[0])
+
+        # join pair -> original relationship condition
+        self.join_pairs = {}
+        for file_path in self.relationships_path.glob("*.json"):
+            with open(file_path, "r") as f:
+                relationship = json.load(f)
+            relationships = (
+                relationship if isinstance(relationship, list) else [relationship]
+            )
+            for rel in relationships:
+                pair = self._parse_condition(rel.get("condition", ""))
+                if pair:
+                    self.join_pairs[pair] = rel["condition"]
+
+    @staticmethod
+    def _parse_condition(condition: str):
+        """Parse a 'table1.col1 = table2.col2' condition into a join pair"""
+        if condition.count("=") != 1:
+            return None
+        sides = []
+        for side in condition.split("="):
+            parts = [part.strip().strip("`\"").lower() for part in side.split(".")]
+            if len(parts) < 2:
+                return None
+            # Keep only table.column, dropping an optional database prefix
+            sides.append((parts[-2], parts[-1]))
+        return frozenset(sides)
+
+    def validate(self, sql: str) -> Dict:
+        """Validate a SQL string and return the structured list of issues found.
+
+        Issues with severity "error" make the query invalid (parse errors,
+        statements that modify data, unknown tables or columns, ambiguous
+        columns). Joins that are not backed by a known relationship are
+        reported as warnings. ``sql`` in the result is the query without
+        markdown fences, the text that should be executed.
+        """
+        issues = []
+        sql = strip_markdown(sql)
+        try:
+            statements = [
+                statement
+                for statement in sqlglot.parse(sql, read=self.dialect)
+                if statement is not None
+            ]
+        except SqlglotError as e:
+            issues.append(
+                self._issue("parse_error", None, f"Could not parse query: {parse_error_message(e)}")
+            )
+            return {"valid": False, "issues": issues, "sql": sql}
+
+        if not statements:
+            issues.append(self._issue("parse_error", None, "No SQL statement found"))
+
+        for statement in statements:
+            if isinstance(statement, READ_ONLY_VIOLATIONS):
+                keyword = statement.sql(dialect=self.dialect).split(None, 1)[0].upper()
+                issues.append(
+                    self._issue(
+                        "read_only",
+                        None,
+                        f"Only read-only queries can be run, {keyword} statements are not allowed.",
+                    )
+                )
+                continue
+            if not isinstance(statement, SUPPORTED_STATEMENTS):
+                # e.g. raw commands or bare expressions from a misspelled keyword
+                issues.append(
+                    self._issue(
+                        "parse_error",
+                        None,
+                        f"Unrecognised statement: {statement.sql(dialect=self.dialect)}",
+                    )
+                )
+                continue
+            issues.extend(self._validate_statement(statement))
+
+        return {
+            "valid": not any(issue["severity"] == "error" for issue in issues),
+            "issues": issues,
+            "sql": sql,
+        }
+
+    def _validate_statement(self, statement: exp.Expression) -> List[Dict]:
+        issues = []
+        try:
+            scopes = traverse_scope(statement)
+        except SqlglotError as e:
+            return [self._issue("parse_error", None, f"Could not analyse query: {e}")]
+
+        seen_columns = set()
+        for scope in scopes:
+            # Resolve every physical table this scope reads from
+            for source in scope.sources.values():
+                if isinstance(source, exp.Table):
+                    issues.extend(self._check_table(source))
+
+            for column in scope.columns:
+                # Columns of correlated subqueries are reported by both scopes
+                if id(column) in seen_columns or isinstance(column.this, exp.Star):
+                    continue
+                seen_columns.add(id(column))
+                issues.extend(self._check_column(scope, column))
+
+            if isinstance(scope.expression, exp.Select):
+                for join in scope.expression.args.get("joins") or []:
+                    issues.extend(self._check_join(scope, join))
+
+        # Each table is reported once even when referenced from several scopes
+        unique_issues = []
+        for issue in issues:
+            if issue not in unique_issues:
+                unique_issues.append(issue)
+        return unique_issues
+
+    def _resolve_table(self, table: exp.Table):
+        """Return the catalog key for a table expression, or None if unknown"""
+        name = table.name.lower()
+        database = table.db.lower()
+        if database:
+            key = (database, name)
+            return key if key in self.tables else None
+        databases = self.table_databases.get(name, [])
+        return (databases[0], name) if len(databases) == 1 else None
+
+    def _check_table(self, table: exp.Table) -> List[Dict]:
+        if not table.name or self._resolve_table(table):
+            return []
+        qualified = ".".join(part for part in (table.db, table.name) if part)
+        databases = self.table_databases.get(table.name.lower(), [])
+        if not table.db and len(databases) > 1:
+            return [
+                self._issue(
+                    "ambiguous_table",
+                    qualified,
+                    f"Table '{table.name}' exists in databases {sorted(databases)}; qualify it with the database name.",
+                )
+            ]
+        known = [f"{db}.{name}" for db, name in self.tables]
+        return [
+            self._issue(
+                "unknown_table",
+                qualified,
+                f"Table '{qualified}' does not exist in the catalog."
+                + self._suggest(qualified.lower(), known),
+            )
+        ]
+
+    def _source_columns(self, source):
+        """Return the lower-cased column names a scope source exposes, or None if unknown"""
+        if isinstance(source, exp.Table):
+            key = self._resolve_table(source)
+            return set(self.tables[key]) if key else None
+        if isinstance(source, Scope):
+            selects = source.expression.named_selects
+            if "*" in selects or any(
+                isinstance(select, exp.Star) or select.is_star
+                for select in source.expression.selects
+            ):
+                return None
+            return {select.lower() for select in selects}
+        return None
+
+    def _check_column(self, scope: Scope, column: exp.Column) -> List[Dict]:
+        name = column.name.lower()
+        qualifier = column.table
+
+        if qualifier:
+            current = scope
+            while current is not None:
+                if qualifier in current.sources:
+                    columns = self._source_columns(current.sources[qualifier])
+                    if columns is None or name in columns:
+                        return []
+                    return [
+                        self._issue(
+                            "unknown_column",
+                            column.sql(dialect=self.dialect),
+                            f"Column '{column.name}' does not exist in '{qualifier}'."
+                            + self._suggest(name, columns),
+                        )
+                    ]
+                current = current.parent
+            return [
+                self._issue(
+                    "unknown_table",
+                    column.sql(dialect=self.dialect),
+                    f"'{qualifier}' is not a table or alias in the FROM clause.",
+                )
+            ]
+
+        # Unqualified column: it must be exposed by exactly one source in scope
+        current = scope
+        while current is not None:
+            matches = []
+            unknown_sources = False
+            for alias, (_, source) in current.selected_sources.items():
+                columns = self._source_columns(source)
+                if columns is None:
+                    unknown_sources = True
+                elif name in columns:
+                    matches.append(alias)
+            if len(matches) > 1:
+                return [
+                    self._issue(
+                        "ambiguous_column",
+                        column.name,
+                        f"Column '{column.name}' exists in {sorted(matches)}; qualify it with the table name.",
+                    )
+                ]
+            if matches or unknown_sources:
+                return []
+            # e.g. ORDER BY total, where total is a select alias
+            aliases = {
+                select.alias.lower()
+                for select in getattr(current.expression, "selects", [])
+                if isinstance(select, exp.Alias)
+            }
+            if name in aliases:
+                return []
+            current = current.parent
+
+        candidates = set()
+        for _, source in scope.selected_sources.values():
+            candidates |= self._source_columns(source) or set()
+        return [
+            self._issue(
+                "unknown_column",
+                column.name,
+                f"Column '{column.name}' does not exist in any table of the query."
+                + self._suggest(name, candidates),
+            )
+        ]
+
+    def _column_origin(self, scope: Scope, column: exp.Column):
+        """Return (table, column) for a column that belongs to a physical table"""
+        qualifier = column.table
+        if qualifier:
+            source = scope.sources.get(qualifier)
+        else:
+            owners = [
+                source
+                for _, source in scope.selected_sources.values()
+                if column.name.lower() in (self._source_columns(source) or set())
+            ]
+            source = owners[0] if len(owners) == 1 else None
+        if isinstance(source, exp.Table) and self._resolve_table(source):
+            return (source.name.lower(), column.name.lower())
+        return None
+
+    def _check_join(self, scope: Scope, join: exp.Join) -> List[Dict]:
+        condition = join.args.get("on")
+        if condition is None:
+            return []
+
+        pairs = []
+        for eq in condition.find_all(exp.EQ):
+            if isinstance(eq.left, exp.Column) and isinstance(eq.right, exp.Column):
+                left = self._column_origin(scope, eq.left)
+                right = self._column_origin(scope, eq.right)
+                if left and right and left[0] != right[0]:
+                    pairs.append((eq, frozenset((left, right))))
+
+        if not pairs or any(pair in self.join_pairs for _, pair in pairs):
+            return []
+
+        joined_tables = {table for table, _ in pairs[0][1]}
+        known = sorted(
+            {
+                condition
+                for pair, condition in self.join_pairs.items()
+                if {table for table, _ in pair} == joined_tables
+            }
+        )
+        message = (
+            f"Join condition '{condition.sql(dialect=self.dialect)}' is not backed by a known relationship."
+        )
+        if known:
+            message += f" Known join conditions: {known}."
+        return [
+            self._issue(
+                "unsupported_join",
+                condition.sql(dialect=self.dialect),
+                message,
+                severity="warning",
+            )
+        ]
+
+    @staticmethod
+    def _suggest(name: str, candidates) -> str:
+        matches = difflib.get_close_matches(name, list(candidates), n=3, cutoff=0.6)
+        return f" Did you mean: {', '.join(matches)}?" if matches else ""
+
+    @staticmethod
+    def _issue(issue_type: str, identifier, message: str, severity: str = "error") -> Dict:
+        return {
+            "type": issue_type,
+            "severity": severity,
+            "identifier": identifier,
+            "message": message,
+        }
+
+    @staticmethod
+    def format_feedback(sql: str, result: Dict) -> str:
+        """Render validation issues as feedback for the SQL generator"""
+        lines = [f"The query failed local validation against the catalog:\n{sql}\n"]
+        for issue in result["issues"]:
+            lines.append(f"- [{issue['severity']}] {issue['type']}: {issue['message']}")
+        return "\n".join(lines)
+
+
+def main():
+    validator = SQLValidator()
+
+    # Example queries
+    test_queries = []
+
+    for query in test_queries:
+        print(f"\nQuery: {query}")
+        result = validator.validate(query)
+        print(f"Valid: {result['valid']}")
+        for issue in result["issues"]:
+            print(f"- [{issue['severity']}] {issue['type']}: {issue['message']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import os
+import json
+from pathlib import Path
+from collections import defaultdict
+from typing import List, Dict, Optional
+from dotenv import load_dotenv
+import numpy as np
+import networkx as nx
+from networkx.algorithms.community import louvain_communities
+from vector_index import ModelVectorIndex
+from ddl_generator import load_relationships, generate_ddl_for_models_and_relationships
+
+load_dotenv()
+
+# Graph construction: relationship edges are the strongest signal, embedding
+# neighbours link tables the relationship generator did not pair up
+SUBJECT_AREA_NEIGHBORS = int(os.getenv("SUBJECT_AREA_NEIGHBORS", "5"))
+SUBJECT_AREA_MIN_EDGE_SIMILARITY = float(os.getenv("SUBJECT_AREA_MIN_EDGE_SIMILARITY", "0.5"))
+SUBJECT_AREA_EMBEDDING_WEIGHT = float(os.getenv("SUBJECT_AREA_EMBEDDING_WEIGHT", "0.5"))
+# Areas above this size are split again with a higher Louvain resolution
+SUBJECT_AREA_MAX_TABLES = int(os.getenv("SUBJECT_AREA_MAX_TABLES", "50"))
+
+# Retrieval: areas kept by the coarse stage, and the margin below the best area
+SUBJECT_AREA_TOP_AREAS = int(os.getenv("SUBJECT_AREA_TOP_AREAS", "3"))
+SUBJECT_AREA_MARGIN = float(os.getenv("SUBJECT_AREA_MARGIN", "0.05"))
+# Tables scoring further below the best table are dropped, unless they join a kept table
+SUBJECT_AREA_TABLE_MARGIN = float(os.getenv("SUBJECT_AREA_TABLE_MARGIN", "0.1"))
+# Cosine similarity floor, equivalent to the squared L2 distance of 1.6 used by flat search
+SUBJECT_AREA_MIN_SIMILARITY = float(os.getenv("SUBJECT_AREA_MIN_SIMILARITY", "0.2"))
+RETRIEVAL_MAX_TABLES = int(os.getenv("RETRIEVAL_MAX_TABLES", "8"))
+
+RELATIONSHIP_WEIGHT = 1.0
+SPLIT_ATTEMPTS = 3
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def table_id(model: Dict) -> str:
+    return f"{model['database']}.{model['name']}"
+
+
+class SubjectAreaBuilder:
+    """Cluster tables into subject areas offline.
+
+    Tables are nodes of a graph whose edges are the generated relationships
+    plus each table's nearest embedding neighbours. Louvain community
+    detection over that graph gives the areas; each area is stored with its
+    centroid, the table pairs its relationships join and a precomputed DDL
+    bundle of its tables and relationships.
+    """
+
+    def __init__(
+        self,
+        models_path: str = "fs_cache/models",
+        relationships_path: str = "fs_cache/relationships",
+        index_path: str = "fs_cache/vector_index",
+        neighbors: int = SUBJECT_AREA_NEIGHBORS,
+        min_edge_similarity: float = SUBJECT_AREA_MIN_EDGE_SIMILARITY,
+        embedding_weight: float = SUBJECT_AREA_EMBEDDING_WEIGHT,
+        max_tables: int = SUBJECT_AREA_MAX_TABLES,
+    ):
+        self.vector_index = ModelVectorIndex(models_path)
+        self.relationships_path = relationships_path
+        self.index_path = index_path
+        self.neighbors = neighbors
+        self.min_edge_similarity = min_edge_similarity
+        self.embedding_weight = embedding_weight
+        self.max_tables = max_tables
+
+    def table_vectors(self, models: Dict[str, Dict]) -> Dict[str, np.ndarray]:
+        """Reuse the table embeddings stored in the vector index, embedding only missing tables"""
+        vectors = {}
+        try:
+            index = self.vector_index.load_index(self.index_path)
+            for position, docstore_id in index.index_to_docstore_id.items():
+                doc = index.docstore.search(docstore_id)
+                key = f"{doc.metadata['database']}.{doc.metadata['table_name']}"
+                if key in models:
+                    vectors[key] = index.index.reconstruct(int(position))
+        except Exception as e:
+            print(f"Warning: Could not read vectors from the index, embedding tables: {str(e)}")
+
+        missing = [key for key in models if key not in vectors]
+        if missing:
+            documents = [self.vector_index.create_model_document(models[key]) for key in missing]
+            embedded = self.vector_index.embeddings.embed_documents(
+                [doc.page_content for doc in documents]
+            )
+            vectors.update(zip(missing, embedded))
+        return {key: np.asarray(vector, dtype=np.float32) for key, vector in vectors.items()}
+
+    def build_graph(self, keys: List[str], vectors: np.ndarray, relationships: List[Dict]) -> nx.Graph:
+        graph = nx.Graph()
+        graph.add_nodes_from(keys)
+
+        # Relationships name tables without their database
+        keys_by_name = defaultdict(list)
+        for key in keys:
+            keys_by_name[key.split(".", 1)[1]].append(key)
+        for rel in relationships:
+            names = rel.get("models", [])
+            if len(names) != 2:
+                continue
+            for left in keys_by_name.get(names[0], []):
+                for right in keys_by_name.get(names[1], []):
+                    if left != right:
+                        graph.add_edge(left, right, weight=RELATIONSHIP_WEIGHT)
+
+        # Nearest embedding neighbours, computed in blocks to bound memory
+        k = min(self.neighbors, len(keys) - 1)
+        if k > 0:
+            for start in range(0, len(keys), 1024):
+                similarities = vectors[start : start + 1024] @ vectors.T
+                for row, scores in enumerate(similarities):
+                    node = start + row
+                    scores[node] = -1.0
+                    for other in np.argpartition(-scores, k - 1)[:k]:
+                        similarity = float(scores[other])
+                        if similarity < self.min_edge_similarity:
+                            continue
+                        weight = similarity * self.embedding_weight
+                        if graph.has_edge(keys[node], keys[other]):
+                            # Already linked by a relationship or as the other table's neighbour
+                            weight = max(weight, graph[keys[node]][keys[other]]["weight"])
+                        graph.add_edge(keys[node], keys[other], weight=weight)
+        return graph
+
+    def detect_communities(self, graph: nx.Graph) -> List[List[str]]:
+        """Louvain communities, splitting the ones larger than max_tables"""
+        pending = [(set(community), 1.0) for community in louvain_communities(graph, weight="weight", seed=0)]
+        communities = []
+        while pending:
+            community, resolution = pending.pop()
+            if len(community) <= self.max_tables or resolution > 2**SPLIT_ATTEMPTS:
+                communities.append(sorted(community))
+                continue
+            parts = louvain_communities(
+                graph.subgraph(community), weight="weight", resolution=resolution * 2, seed=0
+            )
+            if len(parts) == 1:
+                communities.append(sorted(community))
+                continue
+            pending.extend((set(part), resolution * 2) for part in parts)
+        return sorted(communities, key=len, reverse=True)
+
+    def build(self) -> Dict:
+        models = {
+            table_id(model): model for model in self.vector_index.load_model_files()
+        }
+        if not models:
+            raise ValueError("No models found, run the ingestion first")
+        relationships = load_relationships(self.relationships_path)
+        table_vectors = self.table_vectors(models)
+
+        keys = sorted(models)
+        vectors = _normalize(np.stack([table_vectors[key] for key in keys]))
+        graph = self.build_graph(keys, vectors, relationships)
+        communities = self.detect_communities(graph)
+
+        positions = {key: position for position, key in enumerate(keys)}
+        areas, ordered_vectors, centroids = [], [], []
+        offset = 0
+        for number, members in enumerate(communities):
+            member_vectors = vectors[[positions[key] for key in members]]
+            centroid = _normalize(member_vectors.mean(axis=0))
+
+            names = {key.split(".", 1)[1] for key in members}
+            # Relationships name tables without their database
+            members_by_name = defaultdict(list)
+            for key in members:
+                members_by_name[key.split(".", 1)[1]].append(key)
+            joins = sorted(
+                {
+                    tuple(sorted((left, right)))
+                    for rel in relationships
+                    if len(rel.get("models", [])) == 2
+                    for left in members_by_name.get(rel["models"][0], [])
+                    for right in members_by_name.get(rel["models"][1], [])
+                    if left != right
+                }
+            )
+            context = [
+                {
+                    "model": models[key],
+                    "relationships": [
+                        rel
+                        for rel in relationships
+                        if models[key]["name"] in rel.get("models", [])
+                        and all(name in names for name in rel.get("models", []))
+                    ],
+                }
+                for key in members
+            ]
+            # The most connected table names the area
+            label = max(members, key=lambda key: graph.degree(key, weight="weight"))
+            areas.append(
+                {
+                    "id": f"area_{number + 1}",
+                    "label": label,
+                    "tables": members,
+                    "offset": offset,
+                    "joins": [list(pair) for pair in joins],
+                    "ddl": generate_ddl_for_models_and_relationships(context),
+                }
+            )
+            ordered_vectors.append(member_vectors)
+            centroids.append(centroid)
+            offset += len(members)
+
+        return {
+            "areas": areas,
+            "vectors": np.concatenate(ordered_vectors).astype(np.float32),
+            "centroids": np.stack(centroids).astype(np.float32),
+        }
+
+    @staticmethod
+    def save(result: Dict, path: str = "fs_cache/subject_areas"):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "vectors.npy", result["vectors"])
+        np.save(path / "centroids.npy", result["centroids"])
+        # Written last, so a complete areas.json implies complete vector files
+        with open(path / "areas.json", "w") as f:
+            json.dump({"areas": result["areas"]}, f, indent=2)
+
+
+class SubjectAreaIndex:
+    """Coarse-to-fine table search over the subject areas built by SubjectAreaBuilder.
+
+    The coarse stage scores the query against every area centroid and keeps
+    the best areas; the fine stage only scores the tables of those areas.
+    Tables are kept down to a margin below the best table's score, then the
+    tables of the same area that join a kept table are added, so a question
+    spanning two related tables gets both even when it is closer to one.
+    """
+
+    def __init__(
+        self,
+        path: str = "fs_cache/subject_areas",
+        top_areas: int = SUBJECT_AREA_TOP_AREAS,
+        margin: float = SUBJECT_AREA_MARGIN,
+        table_margin: float = SUBJECT_AREA_TABLE_MARGIN,
+        min_similarity: float = SUBJECT_AREA_MIN_SIMILARITY,
+        max_tables: int = RETRIEVAL_MAX_TABLES,
+    ):
+        path = Path(path)
+        with open(path / "areas.json", "r") as f:
+            self.areas = json.load(f)["areas"]
+        self.vectors = np.load(path / "vectors.npy")
+        self.centroids = np.load(path / "centroids.npy")
+        self.top_areas = top_areas
+        self.margin = margin
+        self.table_margin = table_margin
+        self.min_similarity = min_similarity
+        self.max_tables = max_tables
+        self.areas_by_tables = {frozenset(area["tables"]): area for area in self.areas}
+
+    @staticmethod
+    def exists(path: str = "fs_cache/subject_areas") -> bool:
+        return (Path(path) / "areas.json").exists()
+
+    def select_areas(self, query_vector: np.ndarray) -> List[Dict]:
+        scores = self.centroids @ query_vector
+        ranked = np.argsort(-scores)[: self.top_areas]
+        best = float(scores[ranked[0]])
+        return [
+            self.areas[position]
+            for position in ranked
+            if scores[position] >= max(best - self.margin, self.min_similarity)
+        ]
+
+    def search(self, query_vector) -> List[Dict]:
+        """Return [{"table": "db.table", "area": area id, "score": cosine}] best first"""
+        query_vector = _normalize(np.asarray(query_vector, dtype=np.float32))
+        candidates = []
+        # table -> tables of the same area it joins, empty for areas built before joins were stored
+        joins = defaultdict(set)
+        for area in self.select_areas(query_vector):
+            size = len(area["tables"])
+            scores = self.vectors[area["offset"] : area["offset"] + size] @ query_vector
+            candidates.extend(
+                {"table": table, "area": area["id"], "score": float(score)}
+                for table, score in zip(area["tables"], scores)
+            )
+            for left, right in area.get("joins", []):
+                joins[left].add(right)
+                joins[right].add(left)
+        if not candidates:
+            return []
+        candidates.sort(key=lambda result: result["score"], reverse=True)
+
+        # The cut-off follows the query's scores: tables close to the best match
+        threshold = max(self.min_similarity, candidates[0]["score"] - self.table_margin)
+        results = [result for result in candidates if result["score"] >= threshold][: self.max_tables]
+        kept = {result["table"] for result in results}
+        for result in candidates:
+            if len(results) >= self.max_tables:
+                break
+            if result["score"] < self.min_similarity:
+                break
+            if result["table"] not in kept and joins[result["table"]] & kept:
+                results.append(result)
+        return results
+
+    def bundle_for(self, tables: List[str]) -> Optional[str]:
+        """Precomputed DDL when the tables are exactly one subject area, e.g. a small area
+        whose tables all join the best match"""
+        area = self.areas_by_tables.get(frozenset(tables))
+        return area["ddl"] if area else None
+
+
+def main():
+    print("Building subject areas...")
+    builder = SubjectAreaBuilder()
+    result = builder.build()
+    builder.save(result)
+    for area in result["areas"]:
+        print(f"{area['id']} ({area['label']}): {len(area['tables'])} tables")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,33 @@
 import json
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Callable, Optional
 import os
 from dotenv import load_dotenv
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
+from ann_index import ANNIndexBuilder, set_search_params, VECTOR_INDEX_TYPE
+from column_profiler import format_column_profile
 
 load_dotenv()
 
+# Column hits considered per question, and the largest distance still relevant
+COLUMN_SEARCH_K = int(os.getenv("COLUMN_SEARCH_K", "20"))
+COLUMN_MAX_DISTANCE = float(os.getenv("COLUMN_MAX_DISTANCE", "1.1"))
+
 
 class ModelVectorIndex:
-    def __init__(self, models_path: str = "fs_cache/models"):
+    def __init__(
+        self,
+        models_path: str = "fs_cache/models",
+        embeddings=None,
+        index_type: str = VECTOR_INDEX_TYPE,
+    ):
         self.models_path = Path(models_path)
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        # flat, ivf_flat, ivf_pq, hnsw or auto, see ann_index.py
+        self.index_type = index_type
+        # Any langchain Embeddings, e.g. a record/replay cassette for offline runs
+        self.embeddings = embeddings or OpenAIEmbeddings(model="text-embedding-3-small")
 
     def load_model_files(self) -> List[Dict]:
         """Load all JSON model files from the models directory"""
@@ -46,9 +60,61 @@ class ModelVectorIndex:
 
         # Convert models to documents
         documents = [self.create_model_document(model) for model in models]
+        ids = [f"{model['database']}.{model['name']}" for model in models]
+
+        # Create and return the FAISS index, of a type chosen by corpus size
+        index, _ = ANNIndexBuilder(self.embeddings, self.index_type).build(documents, ids)
+        return index
+
+    def index_stream(
+        self,
+        models: Iterable[Dict],
+        path: str = "fs_cache/vector_index",
+        resume: bool = False,
+        batch_size: int = 32,
+        on_indexed: Optional[Callable[[List[Dict]], None]] = None,
+    ) -> Optional[FAISS]:
+        """Embed models as they arrive and persist the index after every batch.
+
+        With resume, the index saved by the interrupted run is extended instead
+        of rebuilt. ``on_indexed`` is called with each batch once it is on disk.
+        """
+        index = None
+        if resume and (Path(path) / "index.faiss").exists():
+            index = self.load_index(path)
+
+        batch = []
+        for model in models:
+            batch.append(model)
+            if len(batch) >= batch_size:
+                index = self._add_to_index(index, batch, path)
+                if on_indexed:
+                    on_indexed(batch)
+                batch = []
+
+        if batch:
+            index = self._add_to_index(index, batch, path)
+            if on_indexed:
+                on_indexed(batch)
+
+        return index
+
+    def _add_to_index(self, index: Optional[FAISS], models: List[Dict], path: str) -> FAISS:
+        documents = [self.create_model_document(model) for model in models]
+        # One document per table, so re-indexing a table replaces its document
+        ids = [f"{model['database']}.{model['name']}" for model in models]
+
+        if index is None:
+            index = FAISS.from_documents(documents, self.embeddings, ids=ids)
+        else:
+            existing = set(index.index_to_docstore_id.values())
+            stale = [doc_id for doc_id in ids if doc_id in existing]
+            if stale:
+                index.delete(stale)
+            index.add_documents(documents, ids=ids)
 
-        # Create and return the FAISS index
-        return FAISS.from_documents(documents, self.embeddings)
+        self.save_index(index, path)
+        return index
 
     def save_index(self, index: FAISS, path: str = "fs_cache/vector_index"):
         """Save the FAISS index to disk"""
@@ -56,9 +122,83 @@ class ModelVectorIndex:
 
     def load_index(self, path: str = "fs_cache/vector_index") -> FAISS:
         """Load the FAISS index from disk"""
-        return FAISS.load_local(
+        index = FAISS.load_local(
             path, self.embeddings, allow_dangerous_deserialization=True
         )
+        # nprobe / efSearch are not stored with the index
+        set_search_params(index.index)
+        return index
+
+
+class ColumnVectorIndex(ModelVectorIndex):
+    """Index one document per column, so a single column can be found among very many.
+
+    Large catalogs have hundreds of thousands of columns, so the index type
+    is chosen by corpus size (see ann_index.py) instead of always flat. Hits
+    are mapped back to their parent tables by search_tables().
+    """
+
+    def create_column_documents(self, model: Dict) -> List[Document]:
+        table_description = model.get("properties", {}).get("description", "")
+        documents = []
+        for col in model["columns"]:
+            description = col.get("properties", {}).get("description", "")
+            profile = format_column_profile(col.get("profile"))
+            content = (
+                f"{model['database']}.{model['name']}.{col['name']} ({col['type']})\n"
+                f"Column: {' '.join(part for part in (description, profile) if part)}\n"
+                f"Table: {table_description}"
+            )
+            metadata = {
+                "table_name": model["name"],
+                "database": model["database"],
+                "column_name": col["name"],
+            }
+            documents.append(Document(page_content=content, metadata=metadata))
+        return documents
+
+    def build_index(self, path: str = "fs_cache/column_index") -> FAISS:
+        """Build and save the column index, with the ground truth for its benchmark"""
+        documents = [
+            document
+            for model in self.load_model_files()
+            for document in self.create_column_documents(model)
+        ]
+        ids = [
+            f"{doc.metadata['database']}.{doc.metadata['table_name']}.{doc.metadata['column_name']}"
+            for doc in documents
+        ]
+        builder = ANNIndexBuilder(self.embeddings, self.index_type)
+        index, ground_truth = builder.build(documents, ids)
+        builder.save(index, ground_truth, path)
+        return index
+
+    def load_index(self, path: str = "fs_cache/column_index") -> FAISS:
+        return super().load_index(path)
+
+    @staticmethod
+    def search_tables(
+        index: FAISS,
+        query_vector: List[float],
+        k: int = COLUMN_SEARCH_K,
+        max_distance: float = COLUMN_MAX_DISTANCE,
+    ) -> List[Dict]:
+        """Group column hits by table: [{"database", "table_name", "score", "columns"}], best first"""
+        tables = {}
+        for doc, score in index.similarity_search_with_score_by_vector(query_vector, k=k):
+            if score > max_distance:
+                continue
+            key = (doc.metadata["database"], doc.metadata["table_name"])
+            if key not in tables:
+                tables[key] = {
+                    "database": key[0],
+                    "table_name": key[1],
+                    "score": float(score),
+                    "columns": [],
+                }
+            tables[key]["columns"].append(doc.metadata["column_name"])
+        # Hits come best first, so each table's score is its best column's distance
+        return sorted(tables.values(), key=lambda table: table["score"])
 
 
 def main():